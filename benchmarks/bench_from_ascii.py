@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the numpy and genfromtxt engines of traj_utils.from_ascii
+
+The trajectory of data/wcb.1 is repeated ntra times to build a larger file.
+
+usage: python benchmarks/bench_from_ascii.py [ntra ...]
+"""
+import os
+import shutil
+import sys
+import time
+from tempfile import mkdtemp
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from package.traj_utils import from_ascii  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data', 'wcb.1')
+
+
+def make_ascii(filename, ntra):
+    """Write an ascii file containing ntra copies of data/wcb.1"""
+    with open(DATA) as fname:
+        lines = fname.readlines()
+    header, body = lines[:4], lines[5:]
+    with open(filename, 'w') as fname:
+        fname.writelines(header)
+        for _ in range(ntra):
+            fname.write(' \n')
+            fname.writelines(body)
+
+
+def timeit(func, repeat=3):
+    """return the best wall time of repeat calls and the last result"""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes):
+    tmpdir = mkdtemp()
+    try:
+        print('{:>8}{:>14}{:>14}{:>10}'.format('ntra', 'genfromtxt', 'numpy',
+                                              'speedup'))
+        for ntra in sizes:
+            filename = os.path.join(tmpdir, 'wcb_{}.1'.format(ntra))
+            make_ascii(filename, ntra)
+            told, (old, _) = timeit(
+                lambda: from_ascii(filename, engine='genfromtxt'), repeat=1)
+            tnew, (new, _) = timeit(lambda: from_ascii(filename))
+            for var in new.dtype.names:
+                if var == 'time':
+                    assert (new[var] == old[var].astype('M8[s]')).all()
+                else:
+                    assert np.array_equal(new[var], old[var], equal_nan=True)
+            print('{:>8}{:>13.3f}s{:>13.3f}s{:>9.1f}x'.format(
+                ntra, told, tnew, told / tnew))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [10, 100, 1000])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Number of segments and render time of plot_trajs with and without the
+Douglas-Peucker simplification (tolerance argument)
+
+The trajectory of data/wcb.1 is shifted in longitude and perturbed by a
+random walk to build ntra trajectories (fixed seed); they are drawn on a
+global Robinson map with the Agg backend and saved as png and pdf.
+
+usage: python benchmarks/bench_simplify.py [ntra ...]
+"""
+import io
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+from cartopy import crs as ccrs  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from package.traj import Tra  # noqa: E402
+from package.traj_plot import plot_trajs  # noqa: E402
+from package.traj_utils import from_ascii  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data', 'wcb.1')
+TOLERANCES = [None, 'auto', 2e5]
+
+
+def make_trajs(ntra, seed=0):
+    """Return ntra perturbed copies of the trajectory of data/wcb.1"""
+    base, _ = from_ascii(DATA)
+    rng = np.random.default_rng(seed)
+    array = np.repeat(base, ntra, axis=0)
+    shape = array.shape
+    array['lon'] += rng.uniform(-180, 180, (ntra, 1)) + \
+        np.cumsum(rng.normal(0, 0.5, shape), axis=1)
+    array['lon'] = (array['lon'] + 180) % 360 - 180
+    array['lat'] += np.cumsum(rng.normal(0, 0.3, shape), axis=1)
+    array['lat'] = np.clip(array['lat'], -89, 89)
+    return Tra(array=array)
+
+
+def render(trajs, tolerance):
+    """Plot trajs and return the number of segments, times and pdf size"""
+    fig = plt.figure(figsize=(8, 4), dpi=100)
+    ax = plt.axes(projection=ccrs.Robinson())
+    ax.set_global()
+    start = time.perf_counter()
+    lc = plot_trajs(ax, trajs, 'p', project=True, tolerance=tolerance)
+    tplot = time.perf_counter() - start
+    start = time.perf_counter()
+    fig.savefig(io.BytesIO(), format='png')
+    tpng = time.perf_counter() - start
+    pdf = io.BytesIO()
+    start = time.perf_counter()
+    fig.savefig(pdf, format='pdf')
+    tpdf = time.perf_counter() - start
+    plt.close(fig)
+    return len(lc.get_segments()), tplot, tpng, tpdf, pdf.tell()
+
+
+def main(sizes):
+    print('{:>8}{:>10}{:>12}{:>10}{:>10}{:>10}{:>10}'.format(
+        'ntra', 'tolerance', 'segments', 'plot', 'png', 'pdf', 'pdf MB'))
+    for ntra in sizes:
+        trajs = make_trajs(ntra)
+        trajs.project(ccrs.Robinson())
+        for tolerance in TOLERANCES:
+            nseg, tplot, tpng, tpdf, size = render(trajs, tolerance)
+            print('{:>8}{:>10}{:>12}{:>9.2f}s{:>9.2f}s{:>9.2f}s{:>10.1f}'
+                  .format(ntra, str(tolerance), nseg, tplot, tpng, tpdf,
+                          size / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000])
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of TrajView on synthetic ensembles
+
+Times the readers and writers, concatenate, plot_trajs and the setup of
+Mapfigure and CartoFigure on files written by benchmarks.synthetic, and
+compares the results with a baseline recorded on the same machine. The
+wall time is the best of `repeat` runs; the peak memory is measured with
+tracemalloc during an extra run (numpy allocations are traced).
+
+The baseline is machine specific and not part of the repository: record
+it with --save-baseline (e.g. before a change) and run again to compare.
+CartoFigure needs the Natural Earth data of cartopy (downloaded on first
+use, or --cartopy-data-dir), it is reported as skipped without them.
+
+usage: python -m benchmarks.run [--ntra N] [--ntime N] [--nvars N]
+                                [--repeat N] [--only name,...]
+                                [--baseline FILE] [--save-baseline]
+                                [--tolerance 0.25] [--output FILE]
+                                [--cartopy-data-dir DIR]
+
+The exit status is 1 if a benchmark is slower or uses more memory than
+the baseline by more than the tolerance. A baseline with another
+configuration or environment (versions, machine, number of cpus) is not
+compared.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.synthetic import write_ensemble  # noqa: E402
+from package.traj import Tra  # noqa: E402
+from package.traj_utils import (from_ascii, from_netcdf, to_ascii,  # noqa
+                                to_netcdf)
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# differences smaller than these are never regressions (timer noise)
+MIN_DIFFERENCE = {'time': 0.01, 'peak_mb': 1.}
+
+
+class Context(object):
+    """Input files and trajectories shared by the benchmarks"""
+
+    def __init__(self, ntra, ntime, nvars):
+        self.ntra, self.ntime, self.nvars = ntra, ntime, nvars
+        self.directory = tempfile.mkdtemp(prefix='trajview_bench_')
+        files = write_ensemble(self.directory, ntra, ntime, nvars)
+        self.ascii, self.netcdf = files['ascii'][0], files['netcdf'][0]
+        self.trajs = Tra(self.netcdf)
+        # ten parts of the ensemble for concatenate
+        step = max(ntra // 10, 1)
+        self.parts = [Tra(array=self.trajs[i:i + step].copy())
+                      for i in range(0, ntra, step)]
+
+    def output(self, name):
+        return os.path.join(self.directory, name)
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def bench_from_ascii(ctx):
+    from_ascii(ctx.ascii)
+
+
+def bench_from_netcdf(ctx):
+    from_netcdf(ctx.netcdf)
+
+
+def bench_to_ascii(ctx):
+    to_ascii(ctx.trajs, ctx.output('out.1'))
+
+
+def bench_to_netcdf(ctx):
+    to_netcdf(ctx.trajs, ctx.output('out.4'))
+
+
+def bench_concatenate(ctx):
+    ctx.parts[0].concatenate(ctx.parts[1:])
+
+
+def bench_plot_trajs(ctx):
+    from cartopy import crs as ccrs
+    from package.traj_plot import plot_trajs
+    # a new Tra each time: the projected points kept by ctx.trajs would
+    # skip the projection in the next runs
+    trajs = Tra(array=ctx.trajs.get_array())
+    fig = plt.figure(figsize=(8, 4), dpi=100)
+    ax = plt.axes(projection=ccrs.PlateCarree())
+    ax.set_global()
+    plot_trajs(ax, trajs, 'p', project=True)
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def bench_mapfigure(ctx):
+    from package.traj_plot import Mapfigure
+    fig = plt.figure()
+    Mapfigure(resolution='l', domain=[-90, 50, 10, 80])
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def bench_cartofigure(ctx):
+    from cartopy import crs as ccrs
+    from package.traj_plot import CartoFigure
+    fig = plt.figure()
+    CartoFigure(plt.axes(projection=ccrs.PlateCarree()),
+                extent=[-90, 50, 10, 80])
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+BENCHMARKS = [
+    ('from_ascii', bench_from_ascii),
+    ('from_netcdf', bench_from_netcdf),
+    ('to_ascii', bench_to_ascii),
+    ('to_netcdf', bench_to_netcdf),
+    ('concatenate', bench_concatenate),
+    ('plot_trajs', bench_plot_trajs),
+    ('mapfigure', bench_mapfigure),
+    ('cartofigure', bench_cartofigure),
+]
+
+
+def measure(function, ctx, repeat=3):
+    """Return the best wall time (s) of repeat runs and the peak traced
+    memory (MB) of one more run"""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function(ctx)
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(ctx)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(times), peak / 1024 ** 2
+
+
+def run(ntra=10000, ntime=41, nvars=3, repeat=3, only=None):
+    """ Run the benchmarks and return the results as a dict
+
+    A benchmark raising an exception (e.g. CartoFigure without the
+    Natural Earth data) is reported as skipped with the error.
+    """
+    results = {'config': {'ntra': ntra, 'ntime': ntime, 'nvars': nvars},
+               'environment': environment(), 'benchmarks': {}}
+    ctx = Context(ntra, ntime, nvars)
+    try:
+        for name, function in BENCHMARKS:
+            if only and name not in only:
+                continue
+            try:
+                wall, peak = measure(function, ctx, repeat=repeat)
+            except Exception as error:  # noqa: B902
+                results['benchmarks'][name] = {
+                    'skipped': '{}: {}'.format(type(error).__name__, error)}
+                continue
+            results['benchmarks'][name] = {'time': round(wall, 4),
+                                           'peak_mb': round(peak, 2)}
+    finally:
+        ctx.close()
+    return results
+
+
+def environment():
+    """Return the versions and machine the benchmarks ran on"""
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__,
+            'machine': platform.machine(), 'system': platform.system(),
+            'cpus': os.cpu_count()}
+
+
+def compare(results, baseline, tolerance=0.25):
+    """ Return the lines of the comparison table and the regressions
+
+    A benchmark regresses if its time or peak memory is larger than
+    (1 + tolerance) times the baseline (and than the baseline plus
+    MIN_DIFFERENCE). The baseline is not used if its config or
+    environment differs from the ones of results.
+    """
+    lines = ['{:<14}{:>10}{:>10}{:>8}{:>11}{:>11}{:>8}'.format(
+        'benchmark', 'time', 'baseline', 'ratio', 'peak MB', 'baseline',
+        'ratio')]
+    regressions = []
+    for key in ('config', 'environment'):
+        if baseline and baseline.get(key) != results[key]:
+            lines.append('baseline {} {} differs from {}, not '
+                         'compared'.format(key, baseline.get(key),
+                                           results[key]))
+            baseline = None
+    reference = baseline['benchmarks'] if baseline else {}
+    for name, result in results['benchmarks'].items():
+        if 'skipped' in result:
+            lines.append('{:<14}skipped ({})'.format(name, result['skipped']))
+            continue
+        base = reference.get(name, {})
+        cells = ['{:<14}'.format(name)]
+        columns = (('time', '{:.3f}s', 10), ('peak_mb', '{:.1f}', 11))
+        for key, fmt, width in columns:
+            cells.append(fmt.format(result[key]).rjust(width))
+            if base.get(key, 0) > 0:
+                ratio = result[key] / base[key]
+                cells.append(fmt.format(base[key]).rjust(width))
+                cells.append('{:.2f}'.format(ratio).rjust(8))
+                if ratio > 1 + tolerance and \
+                        result[key] - base[key] > MIN_DIFFERENCE[key]:
+                    regressions.append('{} {}'.format(name, key))
+            else:
+                cells.append('-'.rjust(width) + '-'.rjust(8))
+        lines.append(''.join(cells))
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks of TrajView on synthetic ensembles')
+    parser.add_argument('--ntra', type=int, default=10000)
+    parser.add_argument('--ntime', type=int, default=41)
+    parser.add_argument('--nvars', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help='comma separated benchmarks')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--output', help='write the results (json)')
+    parser.add_argument('--cartopy-data-dir',
+                        help='directory of the Natural Earth data of cartopy')
+    args = parser.parse_args(argv)
+
+    if args.cartopy_data_dir:
+        import cartopy
+        cartopy.config['data_dir'] = args.cartopy_data_dir
+
+    only = args.only.split(',') if args.only else None
+    results = run(args.ntra, args.ntime, args.nvars, repeat=args.repeat,
+                  only=only)
+    if args.output:
+        with open(args.output, 'w') as fname:
+            json.dump(results, fname, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as fname:
+            json.dump(results, fname, indent=2)
+        print('baseline written to {}'.format(args.baseline))
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as fname:
+            baseline = json.load(fname)
+    lines, regressions = compare(results, baseline, args.tolerance)
+    print('\n'.join(lines))
+    if regressions:
+        print('regressions: {}'.format(', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
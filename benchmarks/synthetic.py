@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic LAGRANTO ensembles
+
+The trajectories start at random positions over the North Atlantic and
+Europe, are advected by a westerly flow with random-walk perturbations of
+the wind, and a part of them ascend like warm conveyor belts; the extra
+variables (T, RH, Q, ...) are smooth functions of the pressure plus
+random walks. The same arguments always give the same trajectories.
+
+usage: python -m benchmarks.synthetic directory [ntra] [ntime] [nvars]
+"""
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from package.traj import Tra  # noqa: E402
+
+# names of the extra variables, then var11, var12, ...
+VARIABLES = ['T', 'RH', 'Q', 'TH', 'PV', 'CP', 'LS', 'U', 'V', 'OMEGA']
+STARTDATE = datetime(2000, 10, 14, 12)
+
+
+def variable_names(nvars):
+    """Return the names of nvars extra variables"""
+    return VARIABLES[:nvars] + ['var{}'.format(i + 1)
+                                for i in range(len(VARIABLES), nvars)]
+
+
+def make_ensemble(ntra=1000, ntime=41, nvars=3, step=6, backward=True,
+                  seed=0, startdate=STARTDATE):
+    """ Return a synthetic ensemble of trajectories
+
+    Parameters
+    ----------
+    ntra, ntime: int
+        number of trajectories and of time steps
+    nvars: int, default 3
+        number of variables besides time, lon, lat and p
+    step: float, default 6
+        output interval in hours
+    backward: bool, default True
+        backward trajectories (times going back from startdate)
+    seed: int, default 0
+        seed of the random generator
+
+    Returns
+    -------
+    Tra
+    """
+    rng = np.random.default_rng(seed)
+    shape = (ntra, ntime)
+    sign = -1 if backward else 1
+    hours = sign * step * np.arange(ntime)
+    dates = np.datetime64(startdate, 's') + \
+        np.around(hours * 3600).astype('timedelta64[s]')
+
+    # wind in degrees per hour: westerly flow with random-walk changes
+    noise = np.sqrt(step / 6.)
+    uwind = 0.4 + np.cumsum(rng.normal(0, 0.05 * noise, shape), axis=1)
+    vwind = np.cumsum(rng.normal(0, 0.04 * noise, shape), axis=1)
+    lon = rng.uniform(-80, 40, (ntra, 1)) + \
+        sign * step * np.cumsum(uwind, axis=1)
+    lat = rng.uniform(25, 65, (ntra, 1)) + \
+        sign * step * np.cumsum(vwind, axis=1)
+    lon, lat = (lon + 180) % 360 - 180, np.clip(lat, -89, 89)
+
+    # a third of the trajectories ascend by 300-700 hPa around a random time
+    p0 = rng.uniform(600, 1000, (ntra, 1))
+    ascent = np.minimum(rng.uniform(300, 700, (ntra, 1)), p0 - 150) * \
+        (rng.random((ntra, 1)) < 0.33)
+    center = rng.uniform(0.2, 0.8, (ntra, 1)) * ntime
+    # time steps in the forward direction of time
+    forward = np.arange(ntime)[::sign][None, :]
+    profile = 1 / (1 + np.exp(-(forward - center) / max(ntime / 20., 1)))
+    p = p0 - ascent * profile + \
+        np.cumsum(rng.normal(0, 5 * noise, shape), axis=1)
+    p = np.clip(p, 100, 1050)
+
+    columns = [('time', dates[None, :].repeat(ntra, axis=0)),
+               ('lon', lon), ('lat', lat), ('p', p)]
+    temperature = 300 * (p / 1000.) ** 0.286 + \
+        np.cumsum(rng.normal(0, 0.5 * noise, shape), axis=1)
+    for i, name in enumerate(variable_names(nvars)):
+        if name == 'T':
+            values = temperature - 273.15
+        elif name == 'TH':
+            values = temperature * (1000. / p) ** 0.286
+        elif name == 'RH':
+            values = np.clip(60 + 40 * profile + np.cumsum(
+                rng.normal(0, 3 * noise, shape), axis=1), 0, 100)
+        elif name == 'Q':
+            values = np.maximum(8 * np.exp((temperature - 288) / 15.), 0)
+        else:
+            values = rng.normal(0, 1, (ntra, 1)) + np.cumsum(
+                rng.normal(0, 0.2 * noise, shape), axis=1) + i
+        columns.append((name, values))
+
+    array = np.empty(shape, dtype=[(name, dates.dtype if name == 'time'
+                                    else 'f8') for name, _ in columns])
+    for name, values in columns:
+        array[name] = values
+    trajs = Tra(array=array)
+    trajs._startdate = startdate
+    return trajs
+
+
+def write_ensemble(directory, ntra=1000, ntime=41, nvars=3,
+                   formats=('ascii', 'netcdf'), nfiles=1, seed=0, **kwargs):
+    """ Write synthetic ensembles in directory
+
+    nfiles files of ntra trajectories are written in each of the formats
+    (ascii, ascii.gz or netcdf), file i with the seed seed + i.
+
+    Returns
+    -------
+    dict: format -> list of filenames
+    """
+    os.makedirs(directory, exist_ok=True)
+    extensions = {'ascii': '.1', 'ascii.gz': '.1.gz', 'netcdf': '.4'}
+    files = {fileformat: [] for fileformat in formats}
+    for i in range(nfiles):
+        trajs = make_ensemble(ntra, ntime, nvars, seed=seed + i, **kwargs)
+        for fileformat in formats:
+            if fileformat not in extensions:
+                raise ValueError('unknown format {}'.format(fileformat))
+            filename = os.path.join(directory, 'lsl_{:03d}{}'.format(
+                i, extensions[fileformat]))
+            if fileformat == 'netcdf':
+                trajs.write(filename, fileformat='netcdf')
+            else:
+                trajs.write(filename, fileformat='ascii',
+                            gz=fileformat == 'ascii.gz')
+            files[fileformat].append(filename)
+    return files
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    arguments = [int(value) for value in sys.argv[2:5]]
+    for fileformat, filenames in write_ensemble(sys.argv[1],
+                                                *arguments).items():
+        print(fileformat, ' '.join(filenames))
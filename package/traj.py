@@ -5,9 +5,14 @@ Created on Wed Jan 19 11:28:37 2022
 
 @author: dboateng
 """
+import os
+import shutil
+import weakref
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from functools import partial
 from functools import wraps
+from glob import glob
 from multiprocessing.pool import Pool
 from tempfile import mkdtemp
 from warnings import warn
@@ -15,7 +20,14 @@ from warnings import warn
 import numpy as np
 from path import Path
 
-from .traj_utils import from_netcdf, to_ascii, from_ascii, to_netcdf
+from .traj_cache import TrajCache, get_cache
+from .traj_index import SpatialIndex
+from .traj_kinematics import DERIVED
+from .traj_resample import align_trajs, resample
+from .traj_select import All
+from .traj_storage import ColumnarArray, append_to_buffer, is_buffer_view
+from .traj_utils import (from_netcdf, to_ascii, from_ascii, to_netcdf,
+                         LazyNetcdf, from_native, to_native, detect_format)
 
 
 class Tra(object):
@@ -31,6 +43,14 @@ class Tra(object):
             Read times as datetime objects, default True
         array: structured array
             If defined creates a new Tra object filled with the array
+        columnar: bool
+            Store each variable in its own array (see ColumnarArray),
+            default False
+        cache: bool, string or TrajCache
+            Keep a binary copy of the parsed file in a TrajCache (True for
+            the default one, or its directory) and load it from there
+            the next times (memory mapped with columnar=True, copied in
+            a structured array otherwise); default None (no cache)
 
     Returns
     -------
@@ -47,12 +67,38 @@ class Tra(object):
     >>> trajs = Tra(filename)
     >>> selected_trajs = Tra(array=trajs[[10, 20, 30], :])
 
+    Read a variable from a netcdf file only when it is used
+
+    >>> trajs = Tra(filename, lazy=True)
+    >>> trajs['p']  # read p
+    >>> trajs.release()  # remove it from memory
+
+    Store the variables as separate arrays to add or remove fields cheaply
+
+    >>> trajs = Tra(filename, columnar=True)
+    >>> trajs['dp'] = trajs['p'] - trajs['p'][:, :1]
+    >>> del trajs['dp']
+
+    Keep a binary copy of the parsed file for the next sessions
+
+    >>> trajs = Tra(filename, cache=True)
+
 
     """
 
     _startdate = None
-
-    def __init__(self, filename='', usedatetime=True, array=None, **kwargs):
+    _buffer = None
+    # (weak reference to the storage, OrderedDict {key: (x, y)}) of the
+    # last projections used, see project
+    _projections = None
+    _max_projections = 4
+    # (weak reference to the storage, {name: array}), see derived
+    _derived = None
+    # growth factor of the storage used by append/concatenate(inplace=True)
+    _growth = 1.5
+
+    def __init__(self, filename='', usedatetime=True, array=None,
+                 columnar=False, cache=None, **kwargs):
         """Initialized a Tra object.
 
         If filename is given, try to load it directly;
@@ -68,16 +114,43 @@ class Tra(object):
                 self._array = None
             else:
                 self._array = array
-            return
-
-        try:
+        else:
+            fileformat = detect_format(filename)
+            if fileformat is None:
+                raise IOError("Unkown fileformat. Known formats "
+                              "are ascii, netcdf or native")
+            if kwargs.get('lazy') or fileformat == 'native':
+                cache = None
+            cache = get_cache(cache)
+            loaded = None
+            if cache is not None:
+                loaded = cache.load(filename, usedatetime=usedatetime,
+                                    **kwargs)
+            if loaded is not None:
+                self._array, self._startdate = loaded
+                # same storage as without the cache
+                if not columnar:
+                    self.to_structured()
+            else:
+                self._load_file(filename, fileformat,
+                                usedatetime=usedatetime, **kwargs)
+                if cache is not None:
+                    cache.save(self, filename, usedatetime=usedatetime,
+                               **kwargs)
+        if columnar and self._array is not None:
+            self.to_columnar()
+
+    def _load_file(self, filename, fileformat, usedatetime=True, **kwargs):
+        """Call the loader corresponding to fileformat (see detect_format)"""
+        if fileformat == 'native':
+            self.load_native(filename, **kwargs)
+        elif fileformat == 'netcdf':
             self.load_netcdf(filename, usedatetime=usedatetime, **kwargs)
-        except (OSError, IOError, RuntimeError):
-            try:
-                self.load_ascii(filename, usedatetime=usedatetime, **kwargs)
-            except Exception:
-                raise IOError("Unkown fileformat. Known formats " 
-                              "are ascii or netcdf")
+        else:
+            if kwargs.pop('lazy', False):
+                warn('lazy loading is only available for netcdf files')
+            kwargs.setdefault('gz', fileformat == 'ascii.gz')
+            self.load_ascii(filename, usedatetime=usedatetime, **kwargs)
 
     def __len__(self):
         return len(self._array)
@@ -91,7 +164,12 @@ class Tra(object):
         return self._array[key]
 
     def __setitem__(self, key, item):
-        if isinstance(key, slice):
+        if not isinstance(key, str) or key in ('lon', 'lat'):
+            self.clear_projections()
+        self._clear_derived_of(key)
+        if isinstance(self._array, ColumnarArray):
+            self._array[key] = item
+        elif isinstance(key, slice):
             self._array[key] = item
         elif key in self.dtype.names:
             self._array[key] = item
@@ -103,7 +181,23 @@ class Tra(object):
             for var in self.variables:
                 newarr[var] = self._array[var]
             newarr[key] = item
-            self._array = newarr
+            self._replace_storage(newarr)
+
+    def __delitem__(self, key):
+        if key in ('lon', 'lat'):
+            self.clear_projections()
+        self._clear_derived_of(key)
+        if isinstance(self._array, ColumnarArray):
+            del self._array[key]
+            return
+        if key not in self.variables:
+            raise KeyError(key)
+        dtypes = [(var, self.dtype[var]) for var in self.variables
+                  if var != key]
+        newarr = np.zeros(self._array.shape, dtype=dtypes)
+        for var, _ in dtypes:
+            newarr[var] = self._array[var]
+        self._replace_storage(newarr)
 
     def __repr__(self):
         try:
@@ -175,6 +269,63 @@ class Tra(object):
                 self._startdate = datetime(1900, 1, 1, 0)
         return self._startdate
 
+    @classmethod
+    def from_files(cls, files, processes=1, **kwargs):
+        """Load and concatenate the trajectories of several files.
+
+        The trajectories of each file are copied in the output array as
+        soon as the file is read, instead of being concatenated afterwards:
+        the output is allocated for len(files) times the trajectories of
+        the first file (and grows if the next files are larger), so the
+        peak memory is the output plus one file.
+        With several `processes`, each worker writes its array in a
+        temporary .npy file (the data go through the disk once, in the
+        temporary directory) which is then memory mapped to fill the
+        preallocated output.
+        All files should contain the same variables and number of timesteps.
+
+        Parameters
+        ----------
+
+            files: string or list of string
+                Glob pattern (e.g. 'June/wcb_*.1') or list of files
+            processes: int, default 1
+                Number of worker processes; None use all the cores
+            kwargs: dict
+                Arguments passed to Tra(filename, **kwargs)
+
+        Returns
+        -------
+        Tra
+            Return a new Tra (trajectories) object
+
+        Examples
+        --------
+
+        >>> trajs = Tra.from_files('June/Trace/Munich/wcb_*.1', processes=4)
+
+        """
+        if isinstance(files, str):
+            pattern = files
+            files = sorted(glob(pattern))
+            if not files:
+                raise IOError('No file matching {}'.format(pattern))
+        files = [str(f) for f in files]
+        kwargs.pop('lazy', None)
+        columnar = kwargs.pop('columnar', False)
+
+        if processes == 1 or len(files) == 1:
+            newarray, buffer, startdate = _load_serial(files, kwargs)
+        else:
+            newarray, startdate = _load_parallel(files, processes, kwargs)
+            buffer = None
+
+        newtrajs = cls(array=newarray, columnar=columnar)
+        if not columnar:
+            newtrajs._buffer = buffer
+        newtrajs._startdate = startdate
+        return newtrajs
+
     def set_array(self, array):
         """To change the trajectories array."""
         self._array = array
@@ -183,7 +334,7 @@ class Tra(object):
         """Return the trajectories array as numpy object"""
         return self._array
 
-    def concatenate(self, trajs, time=False, inplace=False):
+    def concatenate(self, trajs, time=False, inplace=False, align=False):
         """To concatenate trajectories together.
 
         Concatenate trajectories together and return a new object.
@@ -199,7 +350,14 @@ class Tra(object):
             time: bool, default False
                 if True concatenate along the time dimension
             inplace: bool, default False
-                if True append the trajs to current Tra object and return None
+                if True append the trajs to current Tra object and return None;
+                the storage then grows geometrically so that repeated
+                appends only copy each trajectory a constant number of times
+            align: bool, default False
+                if True (and time=False) first resample all the
+                trajectories on a common relative time axis, see
+                align_trajs; trajectories with different output intervals
+                or lengths can then be concatenated
 
         Returns
         -------
@@ -226,6 +384,22 @@ class Tra(object):
         """
         if not isinstance(trajs, (tuple, list)):
             trajs = (trajs,)
+        if align and not time:
+            aligned = align_trajs([self] + list(trajs))
+            if not inplace:
+                return aligned[0].concatenate(aligned[1:])
+            self.clear_projections()
+            self.clear_derived()
+            self._array, self._buffer = aligned[0].get_array(), None
+            trajs = aligned[1:]
+        if inplace:
+            self._append_arrays([tra.get_array() for tra in trajs],
+                                axis=1 if time else 0)
+            return
+        if isinstance(self._array, ColumnarArray):
+            arrays = [self.get_array()] + [tra.get_array() for tra in trajs]
+            return Tra(array=ColumnarArray.concatenate(arrays,
+                                                       axis=1 if time else 0))
         if time:
             trajstuple = (self.T,)
             trajstuple += tuple(tra.T for tra in trajs)
@@ -235,12 +409,268 @@ class Tra(object):
             trajstuple += tuple(tra.get_array() for tra in trajs)
             test = np.concatenate(trajstuple)
 
-        if inplace:
-            self._array = test
+        newtrajs = Tra()
+        newtrajs.set_array(test)
+        return newtrajs
+
+    def _append_arrays(self, arrays, axis=0):
+        """Append arrays along axis using a buffer with spare capacity"""
+        self.clear_projections()
+        self.clear_derived()
+        if isinstance(self._array, ColumnarArray) and \
+                not isinstance(self._array, LazyNetcdf):
+            self._array.append(arrays, axis=axis, growth=self._growth)
+            return
+        current = np.asarray(self._array)
+        arrays = [np.asarray(array) for array in arrays]
+        if any(array.dtype != current.dtype for array in arrays):
+            self._array = np.concatenate([current] + arrays, axis=axis)
+            self._buffer = None
+            return
+        self._array, self._buffer = append_to_buffer(
+            current, self._buffer, arrays, axis=axis, growth=self._growth)
+
+    def project(self, projection, key=None):
+        """Return the positions of the trajectories in a map projection
+
+        The projected coordinates of the last projections used (at most
+        _max_projections) are kept and returned directly the next times,
+        until lon or lat are changed with trajs['lon'] = ..., the storage
+        is replaced or trajectories are appended. Call clear_projections
+        after modifying lon or lat in place (trajs['lon'][0] = ...).
+
+        Parameters
+        ----------
+        projection: cartopy.crs.CRS or callable
+            e.g. the projection of a GeoAxes, or a function returning x, y
+            from lon, lat such as Mapfigure.project
+        key: hashable, optional
+            identifies the projection among the kept ones; by default the
+            proj4 string of a CRS or the callable itself (which is then
+            referenced until it is removed), see Mapfigure.projection_key
+
+        Returns
+        -------
+        x, y: ndarray (ntra, ntime)
+            projected coordinates, nan for the missing points
+        """
+        if key is None:
+            key = getattr(projection, 'proj4_init', projection)
+        if self._projections is None or \
+                self._projections[0]() is not self._array:
+            self._projections = (weakref.ref(self._array), OrderedDict())
+        projected = self._projections[1]
+        if key in projected:
+            projected.move_to_end(key)
+            return projected[key]
+        # copies: transform_points replaces the nan by 0 in place
+        lon = np.array(self['lon'], dtype='f8')
+        lat = np.array(self['lat'], dtype='f8')
+        if hasattr(projection, 'transform_points'):
+            points = projection.transform_points(projection.as_geodetic(),
+                                                 lon, lat)
+            xy = (points[..., 0], points[..., 1])
         else:
-            newtrajs = Tra()
-            newtrajs.set_array(test)
-            return newtrajs
+            xy = projection(lon, lat)
+        projected[key] = xy
+        while len(projected) > self._max_projections:
+            projected.popitem(last=False)
+        return xy
+
+    def spatial_index(self, resolution=1.):
+        """Return a SpatialIndex of the positions of the trajectories
+
+        Used to find the trajectories passing through a box, a polygon
+        or near a point; see SpatialIndex.
+
+        Examples
+        --------
+
+        >>> index = trajs.spatial_index(resolution=0.5)
+        >>> wcb = Tra(array=trajs[index.box(-60, -20, 30, 50)])
+        """
+        return SpatialIndex(self, resolution=resolution)
+
+    def select(self, *criteria, chunksize=100000):
+        """Return the indices of the trajectories matching all the criteria
+
+        The criteria (see traj_select) are evaluated with array operations
+        on chunks of chunksize trajectories; combine them with & and |.
+
+        Examples
+        --------
+
+        >>> from package.traj_select import Fall, InBox, Statistic
+        >>> idx = trajs.select(Fall('p', 600, hours=48),
+        ...                    InBox(-80, -20, 25, 50) | Statistic('RH', 'max',
+        ...                                                        above=90))
+        >>> wcb = Tra(array=trajs[idx])
+        """
+        if not criteria:
+            raise ValueError('at least one criterion is needed')
+        criterion = criteria[0] if len(criteria) == 1 else All(*criteria)
+        return criterion.select(self, chunksize=chunksize)
+
+    def clear_projections(self):
+        """Remove the projected coordinates kept by project"""
+        self._projections = None
+
+    def resample(self, times=None, step=None):
+        """Return the trajectories interpolated on a new time axis
+
+        All the variables are interpolated at once, linearly for the
+        scalars and along the great circle for lon/lat; nan outside of the
+        current times.
+
+        Parameters
+        ----------
+        times: array_like, optional
+            new times, datetime64 or hh.mm relative to the first time step
+            (negative for backward trajectories)
+        step: float, optional
+            new output interval in hours, if times is not given
+
+        Returns
+        -------
+        Tra
+
+        Examples
+        --------
+
+        >>> hourly = trajs.resample(step=1)
+        >>> first_day = trajs.resample(times=np.arange(0, -25, -3))
+        """
+        newtrajs = Tra(array=resample(self._array, times=times, step=step))
+        newtrajs._startdate = self._startdate
+        return newtrajs
+
+    def derived(self, name):
+        """Return a kinematic field derived from the trajectories
+
+        The fields are computed for all the trajectories at once (see
+        traj_kinematics) and kept until the variables they use are changed
+        with trajs[var] = ..., the storage is replaced or trajectories are
+        appended. Call clear_derived after modifying them in place.
+
+        Parameters
+        ----------
+        name: string
+            distance: great-circle distance from the previous step (km)
+            length: length of the path since the first step (km)
+            speed: horizontal speed (m/s)
+            heading: direction of motion (degrees clockwise from north)
+            dpdt: vertical velocity dp/dt (hPa/h)
+
+        Returns
+        -------
+        ndarray (ntra, ntime)
+
+        Examples
+        --------
+
+        >>> speed = trajs.derived('speed')
+        >>> trajs.add_derived('speed', 'dpdt')
+        >>> plot_trajs(ax, trajs, 'speed')
+        """
+        if name not in DERIVED:
+            raise ValueError('unknown derived field {}; available: '
+                             '{}'.format(name, ', '.join(DERIVED)))
+        if self._derived is None or self._derived[0]() is not self._array:
+            self._derived = (weakref.ref(self._array), {})
+        fields = self._derived[1]
+        if name not in fields:
+            function, variables = DERIVED[name]
+            fields[name] = function(*[np.asarray(self[var])
+                                      for var in variables])
+        return fields[name]
+
+    def add_derived(self, *names):
+        """Add derived fields (see derived) as variables
+
+        The fields are added with add_variables, i.e. without copying
+        with the columnar storage and with a single copy otherwise.
+        """
+        self.add_variables(**{name: self.derived(name) for name in names})
+
+    def add_variables(self, **variables):
+        """Add several (ntra, ntime) variables at once
+
+        With the columnar storage the arrays are used as they are (no
+        copy); a structured array is copied once for all the variables
+        instead of once per variable with trajs[var] = ....
+
+        Examples
+        --------
+
+        >>> trajs.add_variables(dp=trajs['p'] - trajs['p'][:, :1],
+        ...                     dt=trajs['T'] - trajs['T'][:, :1])
+        """
+        for name in variables:
+            if name in self.variables:
+                raise ValueError('{} is already a variable'.format(name))
+        if isinstance(self._array, ColumnarArray):
+            for name, values in variables.items():
+                self._array.add_column(name, values)
+            return
+        dtypes = [(str(var), self.dtype[var]) for var in self.variables]
+        dtypes += [(str(name), np.asarray(values).dtype)
+                   for name, values in variables.items()]
+        newarr = np.empty(self._array.shape, dtype=dtypes)
+        for var in self.variables:
+            newarr[var] = self._array[var]
+        for name, values in variables.items():
+            newarr[name] = values
+        self._replace_storage(newarr)
+
+    def clear_derived(self):
+        """Remove the derived fields kept by derived"""
+        self._derived = None
+
+    def _clear_derived_of(self, key):
+        """Remove the derived fields using the variable key"""
+        if self._derived is None:
+            return
+        if not isinstance(key, str):
+            self.clear_derived()
+            return
+        fields = self._derived[1]
+        for name in list(fields):
+            if key in DERIVED[name][1]:
+                del fields[name]
+
+    def _replace_storage(self, array):
+        """Replace the storage by array holding the same lon, lat, p and
+        time (e.g. with a variable added): the derived fields are kept"""
+        derived = self._derived
+        self._array = array
+        if derived is not None:
+            self._derived = (weakref.ref(array), derived[1])
+
+    def trim(self):
+        """Release the spare capacity left by append/concatenate(inplace)
+
+        The trajectories are copied in an array of their exact size.
+        """
+        if isinstance(self._array, ColumnarArray):
+            self._array.trim()
+        elif is_buffer_view(self._array, self._buffer):
+            self._array = self._array.copy()
+        self._buffer = None
+
+    def to_columnar(self):
+        """Store each variable in its own contiguous array
+
+        Adding or removing a variable then does not copy the other ones;
+        see ColumnarArray.
+        """
+        if not isinstance(self._array, ColumnarArray):
+            self._array = ColumnarArray.from_array(self._array)
+            self._buffer = None
+
+    def to_structured(self):
+        """Store the trajectories in a structured array (default storage)"""
+        if isinstance(self._array, ColumnarArray):
+            self._array = self._array.to_array()
 
     def append(self, trajs):
         """append trajectories
@@ -261,34 +691,168 @@ class Tra(object):
         """
         self.concatenate(trajs, inplace=True)
 
-    def write(self, filename, fileformat='netcdf'):
-        """Method to write the trajectories to a file"""
-        globals()['_write_{}'.format(fileformat)](self, filename)
+    def write(self, filename, fileformat='netcdf', **kwargs):
+        """Method to write the trajectories to a file
+
+        Parameters
+        ----------
+        filename: string
+            name of the output file
+        fileformat: string, default netcdf
+            netcdf, ascii or native (alias npy);
+            the native binary format can be memory mapped when loading
+        kwargs: dict
+            passed to the writer (write_netcdf, write_ascii, write_native)
+        """
+        try:
+            writer = globals()['_write_{}'.format(fileformat)]
+        except KeyError:
+            raise ValueError('Unknown fileformat {}; known formats are '
+                             'netcdf, ascii or native'.format(fileformat))
+        writer(self, filename, **kwargs)
 
     def load_netcdf(self, filename, usedatetime=True, msv=-999, unit='hours',
-                    **kwargs):
+                    lazy=False, **kwargs):
         """Method to load trajectories from a netcdf file"""
         self._array, self._startdate = from_netcdf(filename,
                                                    usedatetime=usedatetime,
                                                    msv=msv,
                                                    unit=unit,
+                                                   lazy=lazy,
                                                    **kwargs)
     load_netcdf.__doc__ = from_netcdf.__doc__
 
+    def release(self, variables=None):
+        """Remove lazily loaded variables from memory
+
+        Only used with Tra(filename, lazy=True); the variables are read
+        again from the file at the next access.
+
+        Parameters
+        ----------
+        variables: string or list of string, default all variables
+        """
+        if isinstance(self._array, LazyNetcdf):
+            self._array.release(variables)
+
+    def close(self):
+        """Close the file kept open by Tra(filename, lazy=True)"""
+        if isinstance(self._array, LazyNetcdf):
+            self._array.close()
+
     def write_netcdf(self, filename, exclude=None, unit='hours'):
         """Write netcdf"""
         to_netcdf(self, filename, exclude=exclude, unit=unit)
     write_netcdf.__doc__ = to_netcdf.__doc__
 
-    def write_ascii(self, filename, gz=False, digit=3, mode='w'):
+    def write_native(self, filename):
+        """Write native"""
+        to_native(self, filename)
+    write_native.__doc__ = to_native.__doc__
+
+    def load_native(self, filename, mode='c'):
+        """Load native"""
+        self._array, self._startdate = from_native(filename, mode=mode)
+    load_native.__doc__ = from_native.__doc__
+
+    def write_ascii(self, filename, gz=False, digit=3, mode='w',
+                    blocksize=1000):
         """Write ascii"""
-        to_ascii(self, filename, gz=gz, digit=digit, mode=mode)
+        to_ascii(self, filename, gz=gz, digit=digit, mode=mode,
+                 blocksize=blocksize)
     write_ascii.__doc__ = to_ascii.__doc__
 
-    def load_ascii(self, filename, usedatetime=True, msv=-999.999, gz=False):
+    def load_ascii(self, filename, usedatetime=True, msv=-999.999, gz=False,
+                   engine='numpy'):
         """Load ascii"""
         self._array, self._startdate = from_ascii(filename,
                                                   usedatetime=usedatetime,
                                                   msv=msv,
-                                                  gz=gz)
+                                                  gz=gz,
+                                                  engine=engine)
     load_ascii.__doc__ = from_ascii.__doc__
+
+
+def _write_netcdf(trajs, filename, **kwargs):
+    trajs.write_netcdf(filename, **kwargs)
+
+
+def _write_ascii(trajs, filename, **kwargs):
+    trajs.write_ascii(filename, **kwargs)
+
+
+def _write_native(trajs, filename, **kwargs):
+    trajs.write_native(filename, **kwargs)
+
+
+_write_npy = _write_native
+
+
+def _check_array(filename, array, names, ntime):
+    """Raise a ValueError if array has not the variables names and ntime
+    time steps"""
+    if array.dtype.names != names:
+        raise ValueError('{} does not contain the variables '
+                         '{}'.format(filename, names))
+    if array.shape[1] != ntime:
+        raise ValueError('{} has {} timesteps instead of '
+                         '{}'.format(filename, array.shape[1], ntime))
+
+
+def _load_serial(files, kwargs):
+    """Load files one after the other in a buffer (see Tra.from_files)
+
+    Return the array, the buffer and the startdate of the first file.
+    """
+    trajs = Tra(files[0], **kwargs)
+    startdate, array = trajs.startdate, trajs.get_array()
+    del trajs
+    names, ntime = array.dtype.names, array.shape[1]
+    buffer = np.empty((len(array) * len(files), ntime), dtype=array.dtype)
+    buffer[:len(array)] = array
+    newarray = buffer[:len(array)]
+    for filename in files[1:]:
+        array = Tra(filename, **kwargs).get_array()
+        _check_array(filename, array, names, ntime)
+        newarray, buffer = append_to_buffer(newarray, buffer, [array],
+                                            growth=Tra._growth)
+        del array
+    return newarray, buffer, startdate
+
+
+def _load_parallel(files, processes, kwargs):
+    """Load files in worker processes (see Tra.from_files)
+
+    Return the array and the startdate of the first file.
+    """
+    tmpdir = mkdtemp()
+    try:
+        # the workers save their array in tmpdir, the arrays are then
+        # memory mapped to fill the output one after the other
+        tasks = [(filename, os.path.join(tmpdir, '{}.npy'.format(i)),
+                  kwargs) for i, filename in enumerate(files)]
+        with Pool(processes) as pool:
+            results = pool.map(_load_to_npy, tasks)
+        arrays = [np.load(npyfile, mmap_mode='r') for npyfile, _ in results]
+        names, ntime = arrays[0].dtype.names, arrays[0].shape[1]
+        for filename, array in zip(files, arrays):
+            _check_array(filename, array, names, ntime)
+        ntra = sum(array.shape[0] for array in arrays)
+        newarray = np.empty((ntra, ntime), dtype=arrays[0].dtype)
+        start = 0
+        while arrays:
+            array = arrays.pop(0)
+            newarray[start:start + array.shape[0]] = array
+            start += array.shape[0]
+            del array
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return newarray, results[0][1]
+
+
+def _load_to_npy(task):
+    """Load a file of trajectories and save its array as npy"""
+    filename, npyfile, kwargs = task
+    trajs = Tra(filename, **kwargs)
+    np.save(npyfile, trajs.get_array())
+    return npyfile, trajs.startdate
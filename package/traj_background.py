@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache of map backgrounds
+
+Building a Basemap with coastlines at resolution 'i' takes seconds and
+cartopy projects the Natural Earth features again for every new figure;
+BackgroundCache keeps the Basemap instances and the projected feature
+geometries in memory and pickled on disk so that repeated panels and
+repeated runs reuse them.
+"""
+import copy
+import hashlib
+import json
+import os
+import pickle
+from glob import glob
+from tempfile import mkstemp
+
+from mpl_toolkits.basemap import Basemap, __version__ as basemap_version
+
+from .traj_cache import default_cache_dir
+
+# backgrounds already loaded in this process, shared by all the caches
+_MEMORY = {}
+
+
+class BackgroundCache(object):
+    """ Cache of Basemap instances and projected cartopy features
+
+    Basemap instances are identified by the arguments given to Basemap
+    (domain, projection, resolution, ...), the features by their
+    category, name and scale, the map projection and the extent.
+
+    Parameters
+    ----------
+    directory: string, default $XDG_CACHE_HOME/trajview/backgrounds
+        directory where the backgrounds are pickled
+
+    Examples
+    --------
+
+    >>> m = Mapfigure(domain=[5, 15, 40, 50], cache=True)
+    >>> fig = CartoFigure(ax, extent=[0, 20, 40, 60], cache=True)
+    >>> BackgroundCache().clear()
+    """
+
+    suffix = '.pickle'
+
+    def __init__(self, directory=None):
+        self.directory = directory if directory else \
+            os.path.join(default_cache_dir(), 'backgrounds')
+
+    def __repr__(self):
+        return 'BackgroundCache({!r})'.format(self.directory)
+
+    def key(self, kind, **kwargs):
+        """Return the name of the entry of kind described by kwargs"""
+        identity = json.dumps([kind, kwargs], sort_keys=True,
+                              default=_jsonable)
+        return '{}_{}{}'.format(
+            kind, hashlib.sha1(identity.encode('utf8')).hexdigest()[:24],
+            self.suffix)
+
+    def get(self, key, build):
+        """ Return the entry key, call build() to create it if missing
+
+        The entry is searched in memory, then on disk.
+        """
+        filename = os.path.join(self.directory, key)
+        if filename in _MEMORY:
+            return _MEMORY[filename]
+        try:
+            with open(filename, 'rb') as fname:
+                value = pickle.load(fname)
+        except (OSError, IOError, EOFError, pickle.UnpicklingError,
+                AttributeError, ImportError):
+            value = build()
+            self._save(filename, value)
+        _MEMORY[filename] = value
+        return value
+
+    def _save(self, filename, value):
+        os.makedirs(self.directory, exist_ok=True)
+        handle, tmpfile = mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as fname:
+                pickle.dump(value, fname, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpfile, filename)
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
+    def basemap(self, **kwargs):
+        """Return a Basemap(**kwargs), a shallow copy of the cached one"""
+        key = self.key('basemap', version=basemap_version, **kwargs)
+        return copy.copy(self.get(key, lambda: Basemap(**kwargs)))
+
+    def feature_geometries(self, feature, projection, extent):
+        """ Return the geometries of a Natural Earth feature in projection
+
+        Only the geometries intersecting extent (in the coordinates of
+        the feature) are kept.
+        """
+        scale = feature.scaler.scale_from_extent(extent)
+        key = self.key('feature', category=feature.category,
+                       name=feature.name, scale=scale,
+                       projection=projection.proj4_init,
+                       extent=[round(float(value), 6) for value in extent])
+
+        def build():
+            geometries = []
+            for geometry in feature.intersecting_geometries(extent):
+                projected = projection.project_geometry(geometry,
+                                                        feature.crs)
+                if not projected.is_empty:
+                    geometries.append(projected)
+            return geometries
+
+        return self.get(key, build)
+
+    def clear(self):
+        """Remove all the entries from memory and disk"""
+        for filename in glob(os.path.join(self.directory,
+                                          '*' + self.suffix)):
+            _MEMORY.pop(filename, None)
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+def get_background_cache(cache):
+    """ Return the BackgroundCache described by cache
+
+    cache can be None/False (no cache), True (default cache),
+    a directory or a BackgroundCache instance.
+    """
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return BackgroundCache()
+    if isinstance(cache, BackgroundCache):
+        return cache
+    return BackgroundCache(directory=str(cache))
+
+
+def add_feature(ax, feature, cache=None, **kwargs):
+    """ Add a cartopy feature to a GeoAxes
+
+    With a cache, Natural Earth features are added as geometries already
+    projected in the projection of ax (see
+    BackgroundCache.feature_geometries), which cartopy does not project
+    again; they are limited to the current extent of ax.
+
+    Parameters
+    ----------
+    ax: GeoAxes
+    feature: cartopy.feature.Feature
+    cache: bool, string or BackgroundCache, optional
+        see get_background_cache
+    kwargs: dict
+        style of the feature (edgecolor, linewidth, ...)
+    """
+    cache = get_background_cache(cache)
+    if cache is None or not hasattr(feature, 'scaler'):
+        return ax.add_feature(feature, **kwargs)
+    geometries = cache.feature_geometries(feature, ax.projection,
+                                          ax.get_extent(feature.crs))
+    style = dict(feature.kwargs)
+    style.update(kwargs)
+    return ax.add_geometries(geometries, crs=ax.projection, **style)
+
+
+def _jsonable(value):
+    """Return numpy scalars as python numbers for the keys"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return repr(value)
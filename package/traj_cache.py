@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of parsed trajectory files
+
+The trajectories are stored in the native binary format (see to_native), so
+a cached file is memory mapped instead of being parsed again.
+"""
+import hashlib
+import json
+import os
+from glob import glob
+from tempfile import mkstemp
+
+import numpy as np
+
+from .traj_utils import from_native, to_native
+
+DEFAULT_MAXSIZE = 2 * 1024 ** 3
+
+
+def default_cache_dir():
+    """Return the default cache directory ($XDG_CACHE_HOME/trajview)"""
+    root = os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(root, 'trajview')
+
+
+class TrajCache(object):
+    """ Cache of parsed trajectory files
+
+    An entry is identified by the absolute path, size and modification time
+    of the file and by the arguments used to load it (usedatetime, msv,
+    exclude, date, indices, ...); modifying the file or changing the
+    arguments gives a new entry.
+    When the cache is larger than `maxsize` the least recently used entries
+    are removed.
+
+    Parameters
+    ----------
+    directory: string, default $XDG_CACHE_HOME/trajview
+        directory where the entries are stored
+    maxsize: int, default 2 GiB
+        maximum size of the cache in bytes
+
+    Examples
+    --------
+
+    >>> trajs = Tra(filename, cache=True)  # parse and store
+    >>> trajs = Tra(filename, cache=True)  # memory map the stored copy
+    >>> cache = TrajCache('/scratch/trajcache', maxsize=10 * 1024 ** 3)
+    >>> trajs = Tra(filename, cache=cache)
+    >>> cache.invalidate(filename)
+    >>> cache.clear()
+    """
+
+    suffix = '.traj'
+
+    def __init__(self, directory=None, maxsize=DEFAULT_MAXSIZE):
+        self.directory = directory if directory else default_cache_dir()
+        self.maxsize = maxsize
+
+    def __repr__(self):
+        return 'TrajCache({!r}, maxsize={})'.format(self.directory,
+                                                    self.maxsize)
+
+    @staticmethod
+    def _path_hash(filename):
+        path = os.path.abspath(str(filename))
+        return hashlib.sha1(path.encode('utf8')).hexdigest()[:16]
+
+    def key(self, filename, **kwargs):
+        """Return the name of the entry for filename loaded with kwargs"""
+        stat = os.stat(str(filename))
+        identity = json.dumps([os.path.abspath(str(filename)), stat.st_size,
+                               stat.st_mtime_ns, kwargs],
+                              sort_keys=True, default=_identity)
+        return '{}_{}{}'.format(
+            self._path_hash(filename),
+            hashlib.sha1(identity.encode('utf8')).hexdigest()[:24],
+            self.suffix)
+
+    def _entries(self, prefix='*'):
+        return glob(os.path.join(self.directory, prefix + self.suffix))
+
+    def load(self, filename, **kwargs):
+        """ Return (array, startdate) of the cached entry or None
+
+        array is memory mapped in copy-on-write mode, modifying it
+        does not modify the cache.
+        """
+        entry = os.path.join(self.directory, self.key(filename, **kwargs))
+        try:
+            loaded = from_native(entry, mode='c')
+        except (OSError, IOError, ValueError):
+            return None
+        # mark as recently used
+        os.utime(entry, None)
+        return loaded
+
+    def save(self, trajs, filename, **kwargs):
+        """Store trajs as the entry of filename loaded with kwargs"""
+        os.makedirs(self.directory, exist_ok=True)
+        key = self.key(filename, **kwargs)
+        # entries older than the file come from a previous version of it
+        mtime = os.path.getmtime(str(filename))
+        for entry in self._entries(self._path_hash(filename) + '_*'):
+            if _getmtime(entry) < mtime:
+                _remove(entry)
+        handle, tmpfile = mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(handle)
+        try:
+            to_native(trajs, tmpfile)
+            os.replace(tmpfile, os.path.join(self.directory, key))
+        finally:
+            _remove(tmpfile)
+        self._evict()
+
+    def invalidate(self, filename):
+        """Remove all the entries of filename"""
+        for entry in self._entries(self._path_hash(filename) + '_*'):
+            _remove(entry)
+
+    def clear(self):
+        """Remove all the entries"""
+        for entry in self._entries():
+            _remove(entry)
+
+    @property
+    def size(self):
+        """Return the size of the cache in bytes"""
+        return sum(_getsize(entry) for entry in self._entries())
+
+    def _evict(self):
+        """Remove the least recently used entries above maxsize"""
+        entries = sorted(self._entries(), key=_getmtime)
+        size = sum(_getsize(entry) for entry in entries)
+        while entries and size > self.maxsize:
+            entry = entries.pop(0)
+            size -= _getsize(entry)
+            _remove(entry)
+
+
+def get_cache(cache):
+    """ Return the TrajCache described by cache
+
+    cache can be None/False (no cache), True (default cache),
+    a directory or a TrajCache instance.
+    """
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return TrajCache()
+    if isinstance(cache, TrajCache):
+        return cache
+    return TrajCache(directory=str(cache))
+
+
+def _identity(value):
+    """Return a string identifying value in a key (json default)
+
+    The repr of numpy arrays is shortened with ... above 1000 elements, so
+    the arrays (e.g. indices) are identified by a hash of their content.
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return repr(value.tolist())
+        content = hashlib.sha1(np.ascontiguousarray(value).tobytes())
+        return 'ndarray({}, {}, {})'.format(value.dtype.str,
+                                            list(value.shape),
+                                            content.hexdigest())
+    return repr(value)
+
+
+def _getsize(entry):
+    try:
+        return os.path.getsize(entry)
+    except OSError:
+        return 0
+
+
+def _getmtime(entry):
+    try:
+        return os.path.getmtime(entry)
+    except OSError:
+        return 0
+
+
+def _remove(entry):
+    try:
+        os.remove(entry)
+    except OSError:
+        pass
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clustering of trajectories into transport pathways
+
+Each trajectory is resampled to npoints positions converted to 3D
+points on the sphere (km), so the euclidean distance between two feature
+vectors is the sum of the chord distances of the positions and does not
+depend on the dateline; the pressure can be added as extra features.
+The trajectories are clustered with mini-batch k-means (Sculley, 2010),
+optionally initialized with Ward's hierarchical clustering of a sample;
+the distances are computed with matrix products, by chunks.
+"""
+import numpy as np
+
+from .traj import Tra
+from .traj_geo import EARTH_RADIUS
+
+
+def cluster_trajs(trajs, nclusters, npoints=20, pressure_weight=None,
+                  ward=False, sample=1000, batch_size=4096, max_iter=200,
+                  tol=1e-4, seed=0, chunksize=100000):
+    """ Cluster trajectories into nclusters pathways
+
+    Parameters
+    ----------
+    trajs: Tra or structured array (ntra, ntime)
+        with the variables lon, lat (and p with pressure_weight)
+    nclusters: int
+    npoints: int, default 20
+        number of positions of the resampled trajectories
+    pressure_weight: float, optional
+        if given, p is used as well, pressure_weight km for 1 hPa
+        (e.g. 10: a difference of 100 hPa counts as 1000 km)
+    ward: bool, default False
+        initialize the centers with Ward's clustering of a sample instead
+        of k-means++
+    sample: int, default 1000
+        size of the sample used for the initialization
+    batch_size: int, default 4096
+        number of trajectories of each mini-batch
+    max_iter: int, default 200
+        maximum number of mini-batches
+    tol: float, default 1e-4
+        stop when the centers move less than tol (relative to their size)
+    seed: int, default 0
+        seed of the random generator
+    chunksize: int, default 100000
+        number of trajectories whose distances are computed at once
+
+    Returns
+    -------
+    labels: ndarray of int (ntra,)
+        cluster of each trajectory, -1 for the trajectories with missing
+        positions
+    paths: Tra (nclusters, ntime)
+        mean path of each cluster (time, lon, lat, p if available,
+        label and the fraction of the trajectories in the cluster), e.g.
+        plot_trajs(ax, paths, 'label')
+
+    Examples
+    --------
+
+    >>> labels, paths = cluster_trajs(trajs, 6, pressure_weight=10)
+    >>> plot_trajs(ax, paths, 'label', cmap='tab10', linewidth=3)
+    >>> group = Tra(array=trajs[labels == 2])
+    """
+    rng = np.random.default_rng(seed)
+    features = path_features(trajs, npoints=npoints,
+                             pressure_weight=pressure_weight,
+                             chunksize=chunksize)
+    valid = np.flatnonzero(np.isfinite(features).all(axis=1))
+    if len(valid) < nclusters:
+        raise ValueError('not enough trajectories without missing '
+                         'positions ({})'.format(len(valid)))
+    start = rng.choice(valid, min(sample, len(valid)), replace=False)
+    if ward:
+        centers = _ward_centers(features[start], nclusters)
+    else:
+        centers = _kmeans_plusplus(features[start], nclusters, rng)
+    centers = _minibatch_kmeans(features, valid, centers, rng,
+                                batch_size=batch_size, max_iter=max_iter,
+                                tol=tol)
+    labels = np.full(len(features), -1)
+    for first in range(0, len(valid), chunksize):
+        rows = valid[first:first + chunksize]
+        labels[rows] = _nearest(features[rows], centers)
+    return labels, mean_paths(trajs, labels, nclusters, chunksize=chunksize)
+
+
+def path_features(trajs, npoints=20, pressure_weight=None, chunksize=100000):
+    """ Return the feature vectors (ntra, 3 * npoints [+ npoints]) of trajs
+
+    The positions at npoints regularly spaced time steps (interpolated
+    along the great circle) as 3D points in km, followed by p *
+    pressure_weight if pressure_weight is given; nan if a position is
+    missing.
+    """
+    ntra, ntime = trajs['lon'].shape
+    position = np.linspace(0, ntime - 1, npoints)
+    before = np.minimum(np.floor(position).astype(int), ntime - 2)
+    weight = position - before if ntime > 1 else np.zeros(npoints)
+    before = np.maximum(before, 0)
+    after = np.minimum(before + 1, ntime - 1)
+    nfeatures = 3 * npoints + (npoints if pressure_weight else 0)
+    features = np.empty((ntra, nfeatures), dtype='f4')
+    for first in range(0, ntra, chunksize):
+        rows = slice(first, first + chunksize)
+        xyz = _to_xyz(np.asarray(trajs['lon'][rows]),
+                      np.asarray(trajs['lat'][rows]))
+        points = xyz[:, before] * (1 - weight[:, None]) + \
+            xyz[:, after] * weight[:, None]
+        points /= np.linalg.norm(points, axis=2, keepdims=True)
+        block = [(points * EARTH_RADIUS).reshape(len(points), -1)]
+        if pressure_weight:
+            p = np.asarray(trajs['p'][rows], dtype='f8')
+            block.append((p[:, before] * (1 - weight) + p[:, after] * weight)
+                         * pressure_weight)
+        features[rows] = np.concatenate(block, axis=1)
+    return features
+
+
+def mean_paths(trajs, labels, nclusters, chunksize=100000):
+    """ Return the mean path of each cluster as a Tra (nclusters, ntime)
+
+    lon and lat are averaged on the sphere (mean of the 3D points); the
+    clusters without trajectories are nan. Trajectories with label -1
+    are ignored.
+    """
+    ntra, ntime = trajs['lon'].shape
+    names = ['time', 'lon', 'lat']
+    if 'p' in trajs.dtype.names:
+        names.append('p')
+    valid = labels >= 0
+    count = np.bincount(labels[valid], minlength=nclusters)
+    total = np.zeros((nclusters, ntime, 3))
+    ptotal = np.zeros((nclusters, ntime))
+    pcount = np.zeros((nclusters, ntime))
+    for first in range(0, ntra, chunksize):
+        rows = slice(first, first + chunksize)
+        chunk = labels[rows]
+        keep = chunk >= 0
+        xyz = _to_xyz(np.asarray(trajs['lon'][rows])[keep],
+                      np.asarray(trajs['lat'][rows])[keep])
+        for i in range(3):
+            total[..., i] += _sum_by_label(xyz[..., i], chunk[keep],
+                                           nclusters)
+        if 'p' in names:
+            p = np.asarray(trajs['p'][rows])[keep]
+            ptotal += _sum_by_label(p, chunk[keep], nclusters)
+            pcount += _sum_by_label(np.isfinite(p), chunk[keep], nclusters)
+    meanlon, meanlat = _to_lonlat(total)
+    dtype = [(name, trajs.dtype[name] if name == 'time' else 'f8')
+             for name in names] + [('label', 'f8'), ('fraction', 'f8')]
+    paths = np.zeros((nclusters, ntime), dtype=dtype)
+    paths['time'] = np.asarray(trajs['time'][0])
+    paths['lon'], paths['lat'] = meanlon, meanlat
+    if 'p' in names:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            paths['p'] = ptotal / pcount
+    paths['label'] = np.arange(nclusters)[:, None]
+    paths['fraction'] = (count / max(valid.sum(), 1))[:, None]
+    for name in names[1:]:
+        paths[name][count == 0] = np.nan
+    newtrajs = Tra(array=paths)
+    if isinstance(trajs, Tra):
+        newtrajs._startdate = trajs.startdate
+    return newtrajs
+
+
+def _to_xyz(lon, lat):
+    """Return the unit vectors (..., 3) of lon, lat in degrees"""
+    lon, lat = np.radians(lon), np.radians(lat)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon),
+                     np.sin(lat)], axis=-1)
+
+
+def _to_lonlat(xyz):
+    """Return lon, lat in degrees of the vectors xyz (..., 3)"""
+    lon = np.degrees(np.arctan2(xyz[..., 1], xyz[..., 0]))
+    lat = np.degrees(np.arctan2(xyz[..., 2], np.hypot(xyz[..., 0],
+                                                      xyz[..., 1])))
+    return lon, lat
+
+
+def _sum_by_label(values, labels, nclusters):
+    """Return the sum of values (n, ntime) for each label (nclusters, ntime)
+    (nan are ignored)"""
+    ntime = values.shape[1]
+    index = (labels[:, None] * ntime + np.arange(ntime)).ravel()
+    return np.bincount(index, weights=np.nan_to_num(values.ravel()),
+                       minlength=nclusters * ntime).reshape(nclusters, ntime)
+
+
+def _squared_distances(features, centers):
+    """Return the squared distances (n, ncenters)"""
+    features = features.astype('f8')
+    distances = (features ** 2).sum(axis=1)[:, None] - \
+        2 * features @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    return np.maximum(distances, 0)
+
+
+def _nearest(features, centers):
+    return _squared_distances(features, centers).argmin(axis=1)
+
+
+def _kmeans_plusplus(features, nclusters, rng):
+    """Return nclusters centers chosen by k-means++ among features"""
+    features = features.astype('f8')
+    centers = [features[rng.integers(len(features))]]
+    closest = _squared_distances(features, np.array(centers))[:, 0]
+    for _ in range(1, nclusters):
+        total = closest.sum()
+        if total > 0:
+            index = rng.choice(len(features), p=closest / total)
+        else:
+            index = rng.integers(len(features))
+        centers.append(features[index])
+        closest = np.minimum(closest, _squared_distances(
+            features, features[index][None])[:, 0])
+    return np.array(centers)
+
+
+def _ward_centers(features, nclusters):
+    """ Return the centers of the nclusters clusters of Ward's agglomerative
+    clustering of features
+
+    Lance-Williams updates of the matrix of squared distances, O(n^2)
+    memory and O(n^3) time: use a sample of a few thousands trajectories.
+    """
+    features = features.astype('f8')
+    distances = _squared_distances(features, features)
+    np.fill_diagonal(distances, np.inf)
+    size = np.ones(len(features))
+    members = np.arange(len(features))
+    active = np.ones(len(features), dtype=bool)
+    for _ in range(len(features) - nclusters):
+        i, j = np.unravel_index(distances.argmin(), distances.shape)
+        ni, nj = size[i], size[j]
+        updated = ((ni + size) * distances[i] + (nj + size) * distances[j] -
+                   size * distances[i, j]) / (ni + nj + size)
+        updated[~active] = np.inf
+        updated[i] = np.inf
+        distances[i], distances[:, i] = updated, updated
+        distances[j], distances[:, j] = np.inf, np.inf
+        size[i] += nj
+        active[j] = False
+        members[members == j] = i
+    _, labels = np.unique(members, return_inverse=True)
+    return np.array([features[labels == label].mean(axis=0)
+                     for label in range(nclusters)])
+
+
+def _minibatch_kmeans(features, valid, centers, rng, batch_size=4096,
+                      max_iter=200, tol=1e-4):
+    """ Refine centers with mini-batches of the rows valid of features
+
+    Each center moves to the running mean of all the trajectories
+    assigned to it so far (per-center learning rate 1 / count).
+    """
+    centers = centers.astype('f8')
+    counts = np.zeros(len(centers))
+    scale = np.sqrt((centers ** 2).sum(axis=1).mean())
+    for _ in range(max_iter):
+        batch = features[rng.choice(valid, min(batch_size, len(valid)),
+                                    replace=False)].astype('f8')
+        labels = _nearest(batch, centers)
+        # sums of the batch by label as a product with the one-hot
+        # matrix of the labels (much faster than np.add.at)
+        onehot = labels == np.arange(len(centers))[:, None]
+        batch_counts = onehot.sum(axis=1)
+        sums = onehot.astype('f8') @ batch
+        counts += batch_counts
+        moved = batch_counts > 0
+        previous = centers.copy()
+        centers[moved] += (sums[moved] - batch_counts[moved, None] *
+                           centers[moved]) / counts[moved, None]
+        if np.sqrt(((centers - previous) ** 2).sum(axis=1).max()) < \
+                tol * scale:
+            break
+    return centers
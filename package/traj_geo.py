@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Geometry on the sphere
+
+Vectorized great-circle functions working on arrays of longitudes and
+latitudes in degrees; missing points (nan) give nan.
+"""
+import numpy as np
+
+# mean radius of the earth in km
+EARTH_RADIUS = 6371.
+
+
+def great_circle_distance(lon0, lat0, lon1, lat1, radius=EARTH_RADIUS):
+    """Return the great-circle distance (haversine) in the unit of radius"""
+    lon0, lat0, lon1, lat1 = (np.radians(lon0), np.radians(lat0),
+                              np.radians(lon1), np.radians(lat1))
+    hav = np.sin((lat1 - lat0) / 2) ** 2 + \
+        np.cos(lat0) * np.cos(lat1) * np.sin((lon1 - lon0) / 2) ** 2
+    return 2 * radius * np.arcsin(np.sqrt(np.clip(hav, 0, 1)))
+
+
+def wrap_longitude(lon):
+    """Return lon in [-180, 180)"""
+    return (np.asarray(lon) + 180) % 360 - 180
+
+
+def in_polygon(x, y, lon, lat):
+    """ Return True for the points (x, y) inside the polygon (lon, lat)
+
+    Even-odd rule in the lon/lat plane; the vertices must not cross the
+    dateline.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    lon, lat = np.asarray(lon, dtype='f8'), np.asarray(lat, dtype='f8')
+    inside = np.zeros(np.broadcast(x, y).shape, dtype=bool)
+    # one edge of the polygon at a time
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(len(lon)):
+            x0, y0, x1, y1 = lon[i - 1], lat[i - 1], lon[i], lat[i]
+            inside ^= ((y1 > y) != (y0 > y)) & \
+                (x < (x0 - x1) * (y - y1) / (y0 - y1) + x1)
+    return inside
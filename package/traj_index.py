@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spatial index of trajectories
+
+The points of all trajectories are sorted by the cell of a regular lon/lat
+grid they fall in, so a region query only looks at the points of the cells
+overlapping the region instead of scanning the whole ensemble.
+"""
+import numpy as np
+
+from .traj_geo import (EARTH_RADIUS, great_circle_distance, in_polygon,
+                       wrap_longitude)
+
+
+class SpatialIndex(object):
+    """ Index of the positions of trajectories on a lon/lat grid
+
+    A trajectory is found by a query if at least one of its points
+    (time steps) is inside the region. Building the index sorts all the
+    points once; a query then costs the number of points in the cells
+    overlapping the region.
+
+    Parameters
+    ----------
+    trajs: Tra or structured array (ntra, ntime)
+        with the variables lon and lat (and time for the time windows)
+    resolution: float, default 1
+        size of the cells in degrees
+
+    Examples
+    --------
+
+    >>> index = trajs.spatial_index()
+    >>> idx = index.box(5, 15, 40, 50)
+    >>> selected = Tra(array=trajs[idx])
+    >>> idx = index.polygon([0, 10, 5], [40, 40, 50], start=0, end=24)
+    >>> idx = index.radius(8.5, 47.4, 200)  # 200 km around Zurich
+    """
+
+    def __init__(self, trajs, resolution=1.):
+        self.resolution = resolution
+        self.ncol = int(np.ceil(360. / resolution))
+        self.nrow = int(np.ceil(180. / resolution))
+        lon, lat = np.asarray(trajs['lon']), np.asarray(trajs['lat'])
+        self.shape = lon.shape
+        self.times = None
+        if 'time' in trajs.dtype.names and lon.size:
+            self.times = np.asarray(trajs['time'][0])
+
+        valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+        lon, lat = wrap_longitude(lon.ravel()[valid]), lat.ravel()[valid]
+        cell = self._cell(lon, lat)
+        order = np.argsort(cell, kind='stable')
+        counts = np.bincount(cell, minlength=self.ncol * self.nrow)
+        self.cell_start = np.concatenate([[0], np.cumsum(counts)])
+        valid = valid[order]
+        self.lon, self.lat = lon[order], lat[order]
+        self.trajectory = (valid // self.shape[1]).astype(np.int32)
+        self.timestep = (valid % self.shape[1]).astype(np.int32)
+
+    def __repr__(self):
+        return 'SpatialIndex({} points, resolution={})'.format(
+            len(self.lon), self.resolution)
+
+    def _col(self, lon):
+        col = np.floor((np.asarray(lon) + 180) / self.resolution)
+        return np.clip(col, 0, self.ncol - 1).astype(np.int64)
+
+    def _row(self, lat):
+        row = np.floor((np.asarray(lat) + 90) / self.resolution)
+        return np.clip(row, 0, self.nrow - 1).astype(np.int64)
+
+    def _cell(self, lon, lat):
+        return self._row(lat) * self.ncol + self._col(lon)
+
+    def _candidates(self, lonmin, lonmax, latmin, latmax):
+        """Return the position of the points in the cells of a box"""
+        rows = np.arange(self._row(latmin), self._row(latmax) + 1)
+        if lonmin <= lonmax:
+            cols = np.arange(self._col(lonmin), self._col(lonmax) + 1)
+        else:
+            # the box crosses the dateline
+            cols = np.concatenate([np.arange(self._col(lonmin), self.ncol),
+                                   np.arange(0, self._col(lonmax) + 1)])
+        cells = (rows[:, None] * self.ncol + cols[None, :]).ravel()
+        starts, stops = self.cell_start[cells], self.cell_start[cells + 1]
+        length = stops - starts
+        offset = np.cumsum(length) - length
+        owner = np.repeat(np.arange(len(cells)), length)
+        return starts[owner] + np.arange(length.sum()) - offset[owner]
+
+    def _in_window(self, points, start=None, end=None):
+        """Return the points whose time is between start and end"""
+        if start is None and end is None:
+            return points
+        if self.times is None:
+            raise ValueError('the trajectories have no time variable')
+        allowed = np.ones(len(self.times), dtype=bool)
+        if start is not None:
+            allowed &= self.times >= start
+        if end is not None:
+            allowed &= self.times <= end
+        return points[allowed[self.timestep[points]]]
+
+    def _trajectories(self, points):
+        return np.unique(self.trajectory[points])
+
+    def box(self, lonmin, lonmax, latmin, latmax, start=None, end=None):
+        """ Return the indices of the trajectories passing through a box
+
+        Parameters
+        ----------
+        lonmin, lonmax, latmin, latmax: float
+            limits of the box in degrees, lonmin > lonmax for a box
+            crossing the dateline
+        start, end: datetime64 or float, optional
+            only use the points with start <= time <= end
+
+        Returns
+        -------
+        ndarray of int, sorted trajectory indices
+        """
+        lonmin, lonmax = _lon_range(lonmin, lonmax)
+        points = self._candidates(lonmin, lonmax, latmin, latmax)
+        points = self._in_window(points, start, end)
+        lon, lat = self.lon[points], self.lat[points]
+        if lonmin <= lonmax:
+            inside = (lon >= lonmin) & (lon <= lonmax)
+        else:
+            inside = (lon >= lonmin) | (lon <= lonmax)
+        inside &= (lat >= latmin) & (lat <= latmax)
+        return self._trajectories(points[inside])
+
+    def polygon(self, lon, lat, start=None, end=None):
+        """ Return the indices of the trajectories passing through a polygon
+
+        Parameters
+        ----------
+        lon, lat: array_like
+            vertices of the polygon in degrees (between -180 and 180,
+            not crossing the dateline)
+        start, end: datetime64 or float, optional
+            only use the points with start <= time <= end
+
+        Returns
+        -------
+        ndarray of int, sorted trajectory indices
+        """
+        lon, lat = np.asarray(lon, dtype='f8'), np.asarray(lat, dtype='f8')
+        points = self._candidates(lon.min(), lon.max(), lat.min(), lat.max())
+        points = self._in_window(points, start, end)
+        inside = in_polygon(self.lon[points], self.lat[points], lon, lat)
+        return self._trajectories(points[inside])
+
+    def radius(self, lon, lat, distance, start=None, end=None):
+        """ Return the indices of the trajectories passing near a point
+
+        Parameters
+        ----------
+        lon, lat: float
+            center in degrees
+        distance: float
+            great-circle distance in km
+        start, end: datetime64 or float, optional
+            only use the points with start <= time <= end
+
+        Returns
+        -------
+        ndarray of int, sorted trajectory indices
+        """
+        angle = distance / EARTH_RADIUS
+        dlat = np.degrees(angle)
+        latmin, latmax = max(lat - dlat, -90), min(lat + dlat, 90)
+        if latmin == -90 or latmax == 90 or angle >= np.pi / 2:
+            lonmin, lonmax = -180., 180.
+        else:
+            dlon = np.degrees(np.arcsin(min(np.sin(angle) /
+                                            np.cos(np.radians(lat)), 1)))
+            lonmin, lonmax = _lon_range(lon - dlon, lon + dlon)
+        points = self._candidates(lonmin, lonmax, latmin, latmax)
+        points = self._in_window(points, start, end)
+        near = great_circle_distance(lon, lat, self.lon[points],
+                                     self.lat[points]) <= distance
+        return self._trajectories(points[near])
+
+
+def _lon_range(lonmin, lonmax):
+    """Return the limits of a longitude range in [-180, 180]"""
+    if lonmax - lonmin >= 360:
+        return -180., 180.
+    lonmin, lonmax = wrap_longitude(lonmin), wrap_longitude(lonmax)
+    if lonmax == -180:
+        lonmax = 180.
+    return lonmin, lonmax
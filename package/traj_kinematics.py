@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kinematic fields derived from the positions of the trajectories
+
+Array functions on (ntra, ntime) lon, lat (degrees), p (hPa) and the
+times of the trajectories (datetime64, or hh.mm as read with
+usedatetime=False). The distances are
+great-circle distances, so the dateline needs no special treatment;
+missing values (nan) give nan at the time steps using them.
+
+Speed, heading and dp/dt are centered differences (one-sided at the first
+and last time steps, as numpy.gradient); they are oriented forward in time
+for backward trajectories as well.
+"""
+import numpy as np
+
+from .traj_geo import great_circle_distance
+from .traj_time import hhmm_to_frac
+
+
+def step_distance(lon, lat):
+    """Return the distance (km) from the previous time step, 0 at the
+    first one"""
+    lon, lat = np.asarray(lon, dtype='f8'), np.asarray(lat, dtype='f8')
+    distance = np.zeros(lon.shape)
+    distance[:, 1:] = great_circle_distance(lon[:, :-1], lat[:, :-1],
+                                            lon[:, 1:], lat[:, 1:])
+    return distance
+
+
+def path_length(lon, lat):
+    """Return the length (km) of the path since the first time step
+
+    The steps with a missing position are not counted; the length is nan
+    at the missing positions.
+    """
+    distance = step_distance(lon, lat)
+    length = np.cumsum(np.nan_to_num(distance), axis=1)
+    length[np.isnan(distance)] = np.nan
+    return length
+
+
+def ground_speed(lon, lat, times):
+    """Return the horizontal speed (m/s)"""
+    before, after = _neighbours(np.shape(lon)[1])
+    lon, lat = np.asarray(lon, dtype='f8'), np.asarray(lat, dtype='f8')
+    distance = great_circle_distance(lon[:, before], lat[:, before],
+                                     lon[:, after], lat[:, after])
+    return distance * 1000 / np.abs(_interval(times, before, after))
+
+
+def heading(lon, lat, times):
+    """Return the direction of motion in degrees clockwise from north"""
+    before, after = _neighbours(np.shape(lon)[1])
+    if _backward(times):
+        before, after = after, before
+    lon, lat = np.radians(lon), np.radians(lat)
+    lat0, lat1 = lat[:, before], lat[:, after]
+    dlon = lon[:, after] - lon[:, before]
+    bearing = np.arctan2(np.sin(dlon) * np.cos(lat1),
+                         np.cos(lat0) * np.sin(lat1) -
+                         np.sin(lat0) * np.cos(lat1) * np.cos(dlon))
+    return np.degrees(bearing) % 360
+
+
+def vertical_velocity(p, times):
+    """Return dp/dt (hPa/h)"""
+    before, after = _neighbours(np.shape(p)[1])
+    p = np.asarray(p, dtype='f8')
+    return (p[:, after] - p[:, before]) * 3600 / \
+        _interval(times, before, after)
+
+
+def _neighbours(ntime):
+    """Return the time steps around each time step (as numpy.gradient)"""
+    index = np.arange(ntime)
+    return np.maximum(index - 1, 0), np.minimum(index + 1, ntime - 1)
+
+
+def _seconds(times):
+    """Return the times (datetime64 or hh.mm) of the first trajectory in
+    seconds"""
+    times = np.asarray(times)
+    times = times[0] if times.ndim > 1 else times
+    if np.issubdtype(times.dtype, np.datetime64):
+        return (times - times[0]) / np.timedelta64(1, 's')
+    return hhmm_to_frac(times) * 3600
+
+
+def _interval(times, before, after):
+    """Return the time in seconds between before and after (nan if 0)"""
+    seconds = _seconds(times)
+    interval = seconds[after] - seconds[before]
+    return np.where(interval == 0, np.nan, interval)
+
+
+def _backward(times):
+    seconds = _seconds(times)
+    return len(seconds) > 1 and seconds[-1] < seconds[0]
+
+
+# name: (function, variables used), see Tra.derived
+DERIVED = {
+    'distance': (step_distance, ('lon', 'lat')),
+    'length': (path_length, ('lon', 'lat')),
+    'speed': (ground_speed, ('lon', 'lat', 'time')),
+    'heading': (heading, ('lon', 'lat', 'time')),
+    'dpdt': (vertical_velocity, ('p', 'time')),
+}
@@ -29,6 +29,8 @@ from matplotlib.pyplot import subplot
 from cartopy.mpl.ticker import (LongitudeFormatter, LatitudeFormatter,
                                 LatitudeLocator)
 
+from .traj_background import add_feature, get_background_cache
+
 def apply_style(fontsize=20, style=None, linewidth=2):
     """
     
@@ -55,7 +57,8 @@ def apply_style(fontsize=20, style=None, linewidth=2):
     mpl.rc("font", weight="bold")
 
 
-def plot_trajs(ax, trajs, variable, cmap='Spectral', levels=None, **kwargs):
+def plot_trajs(ax, trajs, variable, cmap='Spectral', levels=None,
+               dateline=True, project=False, tolerance=None, **kwargs):
     """Plot trajectories on axis
 
     Parameters
@@ -65,7 +68,25 @@ def plot_trajs(ax, trajs, variable, cmap='Spectral', levels=None, **kwargs):
     variable: string
     cmap: string
     levels: ndarray
-    transform: CRS (Coordinate Reference System) object, default ccrs.Geodetic()
+    dateline: bool or float, default True
+        split the segments crossing the dateline of the map
+        (central longitude + 180) at the boundary; a float gives the
+        central longitude, True takes it from the projection of a GeoAxes
+    project: bool, default False
+        with a GeoAxes, project the points once with the projection of the
+        map and build the segments in projected coordinates instead of
+        letting cartopy transform every segment at each draw; the projected
+        points are kept by trajs (see Tra.project) for the next plots
+    tolerance: float or 'auto', optional
+        simplify each trajectory with the Douglas-Peucker algorithm,
+        removing the points closer than tolerance to the simplified path;
+        in the plotted coordinates, i.e. projected units if project is True,
+        else degrees. 'auto' uses the size of a pixel of ax (see pixel_size).
+        The value of a simplified segment is the mean of the values of the
+        segments it replaces
+    transform: CRS (Coordinate Reference System) object,
+        default ccrs.Geodetic() (great circles); ax.transData if project
+        is True
     kwargs: dict,
         passed to LineCollection
 
@@ -77,25 +98,76 @@ def plot_trajs(ax, trajs, variable, cmap='Spectral', levels=None, **kwargs):
     >>>    ax = plt.axes(projection=ccrs.PlateCarree(central_longitude=45))
     >>>    lc = plot_trajs(ax, trajs, 'z')
 
+    Draw tens of thousands of trajectories at the resolution of the figure
+
+    >>>    lc = plot_trajs(ax, trajs, 'z', project=True, tolerance='auto')
+
+    """
+    central_longitude = None
+    if dateline is True:
+        if isinstance(ax, GeoAxes):
+            central_longitude = ax.projection.proj4_params.get('lon_0', 0)
+    elif dateline is not False and dateline is not None:
+        central_longitude = dateline
+    values = trajs[variable]
+    projection, xy = None, None
+    if project and isinstance(ax, GeoAxes):
+        projection = ax.projection
+        if hasattr(trajs, 'project'):
+            xy = trajs.project(projection)
+        kwargs.setdefault('transform', ax.transData)
+    if tolerance == 'auto':
+        crs = None
+        if projection is None and isinstance(ax, GeoAxes):
+            crs = ccrs.PlateCarree()
+        tolerance = pixel_size(ax, crs=crs)
+    segments, colors = _get_segments(trajs['lon'], trajs['lat'], values,
+                                     central_longitude=central_longitude,
+                                     projection=projection, xy=xy,
+                                     tolerance=tolerance)
+    if isinstance(ax, GeoAxes):
+        kwargs.setdefault('transform', ccrs.Geodetic())
+    return _plot_segments(ax, segments, colors, values, cmap=cmap,
+                          levels=levels, **kwargs)
+
+
+def pixel_size(ax, crs=None):
+    """ Return the size of a pixel of ax in data units
+
+    Parameters
+    ----------
+    ax: matplotlib.Axes
+    crs: cartopy.crs.CRS, optional
+        with a GeoAxes, return the size in the coordinates of crs
+        (e.g. degrees with ccrs.PlateCarree()) instead of the projection
+
+    The size is computed at the dpi of the figure, with the current limits
+    of ax; set the extent of a map before calling it.
+    """
+    bbox = ax.get_window_extent()
+    if crs is None:
+        (x0, x1), (y0, y1) = ax.get_xlim(), ax.get_ylim()
+    else:
+        x0, x1, y0, y1 = ax.get_extent(crs)
+    return min(abs(x1 - x0) / bbox.width, abs(y1 - y0) / bbox.height)
+
+
+def _plot_segments(ax, segments, colors, values, cmap='Spectral',
+                   levels=None, **kwargs):
+    """Add the segments as a LineCollection to ax
+
+    values are the values of the plotted variable used to define the
+    default levels
     """
-    segments, colors = list(zip(*
-                                [(_get_segments(traj),
-                                  traj[variable][:-1])
-                                 for traj in trajs])
-                           )
-    segments = np.concatenate(segments)
-    colors = np.concatenate(colors)
     cmap = get_cmap(cmap)
     if levels is None:
-        minlev = np.nanmin(trajs[variable])
-        maxlev = np.nanmax(trajs[variable])
+        minlev = np.nanmin(values)
+        maxlev = np.nanmax(values)
         levels = np.linspace(minlev, maxlev, 20)
     norm = BoundaryNorm(levels, cmap.N)
     nkwargs = {'array': colors,
                'cmap': cmap,
                'norm': norm}
-    if isinstance(ax, GeoAxes):
-        nkwargs['transform'] = ccrs.Geodetic()
     nkwargs.update(kwargs)
     lc = LineCollection(segments, **nkwargs)
 
@@ -103,22 +175,413 @@ def plot_trajs(ax, trajs, variable, cmap='Spectral', levels=None, **kwargs):
 
     return lc
 
-def _get_segments(trajs):
-    lon, lat = trajs['lon'], trajs['lat']
-    points = np.array([lon, lat]).T.reshape(-1, 1, 2)
-    segments = np.concatenate([points[:-1], points[1:]], axis=1)
-    # remove all segments crossing the 180th meridian !! to be improved
-    # diff = segments[:, 0, 0] - segments[:, 1, 0]
-    # maxval = abs(self.m(-179, 0)[0] - self.m(179, 0)[0])
-    # index = np.where((diff < maxval) & (diff > -maxval))
-    return segments  # [index[0], :, :]
 
+def plot_density(ax, trajs, variable=None, bins=100, extent=None,
+                 statistic='mean', cmap='Spectral_r', dateline=True,
+                 project=False, **kwargs):
+    """Plot the density of trajectories on a grid
+
+    The segments of all trajectories are accumulated on a regular grid
+    (see density_grid) and drawn with a single pcolormesh, so the cost
+    depends on the number of points and not on the number of trajectories.
+
+    Parameters
+    ----------
+    ax:
+    trajs: Tra (from dypy.lagranto) object
+    variable: string, optional
+        if given, plot the mean (or sum) of variable in each cell instead
+        of the number of time steps spent in the cell
+    bins: int or (int, int), default 100
+        number of cells in x and y
+    extent: list, optional
+        [xmin, xmax, ymin, ymax] of the grid, in degrees or in projected
+        units if project is True; default the extent of the trajectories
+        (a ValueError is raised if they have no valid segment)
+    statistic: string, default mean
+        mean or sum of variable in each cell
+    cmap: string
+    dateline, project:
+        see plot_trajs
+    kwargs: dict,
+        passed to pcolormesh
+
+    Returns
+    -------
+    QuadMesh
+
+    Examples
+    --------
+
+    >>>    ax = plt.axes(projection=ccrs.PlateCarree())
+    >>>    mesh = plot_density(ax, trajs, bins=(360, 180),
+    >>>                        extent=[-180, 180, -90, 90])
+    >>>    plt.colorbar(mesh)
+    """
+    central_longitude = None
+    if dateline is True:
+        if isinstance(ax, GeoAxes):
+            central_longitude = ax.projection.proj4_params.get('lon_0', 0)
+    elif dateline is not False and dateline is not None:
+        central_longitude = dateline
+    projection, xy = None, None
+    if project and isinstance(ax, GeoAxes):
+        projection = ax.projection
+        if hasattr(trajs, 'project'):
+            xy = trajs.project(projection)
+    elif isinstance(ax, GeoAxes):
+        kwargs.setdefault('transform', ccrs.PlateCarree())
+    values = trajs[variable] if variable else np.broadcast_to(
+        0., np.shape(trajs['lon']))
+    segments, colors = _get_segments(trajs['lon'], trajs['lat'], values,
+                                     central_longitude=central_longitude,
+                                     projection=projection, xy=xy)
+    return _plot_density(ax, segments, colors if variable else None,
+                         bins=bins, extent=extent, statistic=statistic,
+                         cmap=cmap, **kwargs)
+
+
+def _plot_density(ax, segments, colors=None, bins=100, extent=None,
+                  statistic='mean', cmap='Spectral_r', **kwargs):
+    """Add the density of the segments to ax with pcolormesh"""
+    if statistic not in ('mean', 'sum'):
+        raise ValueError('statistic must be mean or sum')
+    if extent is None:
+        if not len(segments):
+            raise ValueError('no segment without missing positions, give '
+                             'the extent to plot an empty grid')
+        extent = [segments[..., 0].min(), segments[..., 0].max(),
+                  segments[..., 1].min(), segments[..., 1].max()]
+    nx, ny = (bins, bins) if np.ndim(bins) == 0 else bins
+    xedges = np.linspace(extent[0], extent[1], nx + 1)
+    yedges = np.linspace(extent[2], extent[3], ny + 1)
+    count, total = density_grid(segments, xedges, yedges, values=colors)
+    if colors is None:
+        grid = count
+    elif statistic == 'sum':
+        grid = total
+    else:
+        grid = np.divide(total, count, out=np.zeros_like(total),
+                         where=count > 0)
+    grid = np.ma.masked_where(count == 0, grid)
+    mesh = ax.pcolormesh(xedges, yedges, grid, cmap=cmap, **kwargs)
+    return mesh
+
+
+def density_grid(segments, xedges, yedges, values=None):
+    """ Accumulate segments on a regular grid
+
+    Each segment is sampled at points closer than a cell to each other,
+    the samples of a segment have a total weight of 1 (one time step),
+    so a cell receives the number of time steps spent in it whatever the
+    length of the segments.
+
+    Parameters
+    ----------
+    segments: ndarray (nseg, 2, 2)
+        see _get_segments
+    xedges, yedges: ndarray
+        regularly spaced edges of the cells
+    values: ndarray (nseg,), optional
+        value of each segment
+
+    Returns
+    -------
+    count: ndarray (ny, nx)
+        number of time steps in each cell
+    total: ndarray (ny, nx) or None
+        sum of the values weighted by the time steps if values is given
+    """
+    nx, ny = len(xedges) - 1, len(yedges) - 1
+    dx = (xedges[-1] - xedges[0]) / nx
+    dy = (yedges[-1] - yedges[0]) / ny
+    x0, y0 = segments[:, 0, 0], segments[:, 0, 1]
+    xlen = segments[:, 1, 0] - x0
+    ylen = segments[:, 1, 1] - y0
+    nsample = np.maximum(np.ceil(np.maximum(np.abs(xlen / dx),
+                                            np.abs(ylen / dy))), 1)
+    nsample = nsample.astype(np.int64)
+
+    # sample each segment at the middle of nsample equal parts
+    owner = np.repeat(np.arange(len(segments)), nsample)
+    offset = np.cumsum(nsample) - nsample
+    frac = (np.arange(nsample.sum()) - offset[owner] + 0.5) / nsample[owner]
+    col = np.floor((x0[owner] + frac * xlen[owner] - xedges[0]) / dx)
+    row = np.floor((y0[owner] + frac * ylen[owner] - yedges[0]) / dy)
+    inside = (col >= 0) & (col < nx) & (row >= 0) & (row < ny)
+    cell = (row[inside] * nx + col[inside]).astype(np.int64)
+    owner = owner[inside]
+    weight = 1. / nsample[owner]
+
+    # (bincount returns integers without any sample)
+    count = np.bincount(cell, weights=weight, minlength=nx * ny)
+    total = None
+    if values is not None:
+        total = np.bincount(cell, weights=weight * values[owner],
+                            minlength=nx * ny).astype('f8').reshape(ny, nx)
+    return count.astype('f8').reshape(ny, nx), total
+
+
+def _get_segments(lon, lat, values, central_longitude=None, projection=None,
+                  xy=None, tolerance=None):
+    """Return the segments of all trajectories and their values
+
+    Parameters
+    ----------
+    lon, lat, values: ndarray (ntra, ntime)
+    central_longitude: float, optional
+        if given, the longitudes are wrapped into
+        [central_longitude - 180, central_longitude + 180) and the segments
+        crossing the boundary are split there (see _split_dateline)
+    projection: cartopy.crs.CRS or callable, optional
+        if given, return the segments in projected coordinates;
+        a callable returns x, y from lon, lat (e.g. Mapfigure.project)
+    xy: tuple of ndarray (ntra, ntime), optional
+        the points already projected with projection
+    tolerance: float, optional
+        if given, simplify the trajectories (see _douglas_peucker)
+
+    Returns
+    -------
+    segments: ndarray (nseg, 2, 2)
+        [[lon0, lat0], [lon1, lat1]] (or [[x0, y0], [x1, y1]] with a
+        projection) of each segment; segments with a missing (nan) end,
+        e.g. trajectories leaving the domain, are removed
+    colors: ndarray (nseg,)
+        value at the start of each segment, or mean of the values of the
+        replaced segments if simplified
+    """
+    lon, lat, values = (np.atleast_2d(lon), np.atleast_2d(lat),
+                        np.atleast_2d(values))
+    if central_longitude is not None:
+        lon = _wrap_longitude(lon, central_longitude)
+    if projection is not None and xy is None:
+        xy = _project_points(projection, lon, lat)
+    start = end = None
+    if tolerance:
+        x, y = xy if projection is not None else (lon, lat)
+        start, end = _kept_pairs(_douglas_peucker(x, y, tolerance))
+    segments = _pairs(lon, lat, start, end)
+    valid = np.isfinite(segments).all(axis=(1, 2))
+    if projection is not None:
+        projected = _pairs(xy[0], xy[1], start, end)
+        valid &= np.isfinite(projected).all(axis=(1, 2))
+    if start is None:
+        colors, end_colors = values[:, :-1].ravel(), values[:, 1:].ravel()
+    else:
+        colors = _mean_values(values, start, end)
+        end_colors = values.ravel()[end]
+    segments, colors = segments[valid], colors[valid]
+    repeat = None
+    if central_longitude is not None:
+        segments, colors, repeat, first = _split_dateline(
+            segments, colors, end_colors[valid], central_longitude)
+    if projection is None:
+        return segments, colors
+
+    projected = projected[valid]
+    if repeat is not None:
+        # only the points added at the dateline are projected again,
+        # slightly inside the boundary which proj would wrap
+        projected = projected[repeat]
+        for index, end in ((first, 1), (first + 1, 0)):
+            lon, lat = segments[index, end, 0], segments[index, end, 1]
+            lon = lon - np.sign(lon - central_longitude) * 1e-6
+            projected[index, end, 0], projected[index, end, 1] = \
+                _project_points(projection, lon, lat)
+    return projected, colors
+
+
+def _pairs(x, y, start=None, end=None):
+    """ Return the segments (nseg, 2, 2) joining the points
+
+    By default each point is joined to the next one of the trajectory,
+    else the points of the flat indices start are joined to those of end.
+    """
+    if start is None:
+        ntra, ntime = x.shape
+        segments = np.empty((ntra, ntime - 1, 2, 2))
+        segments[:, :, 0, 0] = x[:, :-1]
+        segments[:, :, 1, 0] = x[:, 1:]
+        segments[:, :, 0, 1] = y[:, :-1]
+        segments[:, :, 1, 1] = y[:, 1:]
+        return segments.reshape(-1, 2, 2)
+    x, y = np.ravel(x), np.ravel(y)
+    segments = np.empty((len(start), 2, 2))
+    segments[:, 0, 0] = x[start]
+    segments[:, 1, 0] = x[end]
+    segments[:, 0, 1] = y[start]
+    segments[:, 1, 1] = y[end]
+    return segments
+
+
+def _douglas_peucker(x, y, tolerance):
+    """ Simplify all the trajectories with the Douglas-Peucker algorithm
+
+    A point is kept if it is farther than tolerance from the segment
+    joining the kept points around it. The trajectories are processed
+    together, one level of the recursion at a time, so the cost is a few
+    array operations per level. Missing (nan) points split the paths and
+    are kept.
+
+    Parameters
+    ----------
+    x, y: ndarray (ntra, ntime)
+    tolerance: float
+
+    Returns
+    -------
+    keep: ndarray of bool (ntra, ntime)
+    """
+    finite = np.isfinite(x) & np.isfinite(y)
+    shape = finite.shape
+    x, y = np.ravel(x), np.ravel(y)
+    keep = ~finite.ravel()
+
+    # each run of valid points is a path
+    previous = np.zeros(shape, dtype=bool)
+    previous[:, 1:] = finite[:, :-1]
+    following = np.zeros(shape, dtype=bool)
+    following[:, :-1] = finite[:, 1:]
+    start = np.flatnonzero(finite & ~previous)
+    end = np.flatnonzero(finite & ~following)
+    keep[start] = True
+    keep[end] = True
+
+    while True:
+        inner = end - start - 1
+        todo = inner > 0
+        start, end, inner = start[todo], end[todo], inner[todo]
+        if not len(start):
+            break
+        # the inner points of all the paths one after the other
+        owner = np.repeat(np.arange(len(start)), inner)
+        offset = np.cumsum(inner) - inner
+        point = start[owner] + 1 + np.arange(inner.sum()) - offset[owner]
+        distance = _distance_to_segment(x[point], y[point],
+                                        x[start][owner], y[start][owner],
+                                        x[end][owner], y[end][owner])
+        maximum = np.maximum.reduceat(distance, offset)
+        farthest = np.minimum.reduceat(
+            np.where(distance == maximum[owner], point, len(x)),
+            offset)
+        far = maximum > tolerance
+        farthest = farthest[far]
+        keep[farthest] = True
+        start = np.concatenate([start[far], farthest])
+        end = np.concatenate([farthest, end[far]])
+    return keep.reshape(shape)
+
+
+def _distance_to_segment(x, y, x0, y0, x1, y1):
+    """Return the distance of the points x, y to the segments x0, y0, x1, y1"""
+    dx, dy = x1 - x0, y1 - y0
+    length = dx * dx + dy * dy
+    frac = (x - x0) * dx + (y - y0) * dy
+    frac = np.divide(frac, length, out=np.zeros(np.broadcast(frac,
+                                                             length).shape),
+                     where=length > 0)
+    frac = np.clip(frac, 0, 1)
+    return np.hypot(x - x0 - frac * dx, y - y0 - frac * dy)
+
+
+def _kept_pairs(keep):
+    """Return the flat indices of the kept points joined by segments"""
+    ntime = keep.shape[1]
+    kept = np.flatnonzero(keep)
+    start, end = kept[:-1], kept[1:]
+    same = start // ntime == end // ntime
+    return start[same], end[same]
+
+
+def _mean_values(values, start, end):
+    """Return the mean of values between the flat indices start and end - 1"""
+    values = np.ravel(values).astype('f8')
+    finite = np.isfinite(values)
+    total = np.concatenate([[0], np.cumsum(np.where(finite, values, 0))])
+    count = np.concatenate([[0], np.cumsum(finite)])
+    count = count[end] - count[start]
+    return np.divide(total[end] - total[start], count,
+                     out=np.full(len(start), np.nan), where=count > 0)
+
+
+def _project_points(projection, lon, lat):
+    """Return x, y of the points lon, lat in the projection
+
+    projection is a cartopy CRS or a callable returning x, y; lon and lat
+    are copied since transform_points replaces the nan by 0 in place
+    """
+    lon, lat = np.array(lon, dtype='f8'), np.array(lat, dtype='f8')
+    if not hasattr(projection, 'transform_points'):
+        return projection(lon, lat)
+    points = projection.transform_points(projection.as_geodetic(), lon, lat)
+    return points[..., 0], points[..., 1]
+
+
+def _wrap_longitude(lon, central_longitude):
+    """Return lon in [central_longitude - 180, central_longitude + 180)"""
+    lon = np.where(lon < central_longitude - 180, lon + 360, lon)
+    return np.where(lon >= central_longitude + 180, lon - 360, lon)
+
+
+def _split_dateline(segments, colors, end_colors, central_longitude=0):
+    """ Split the segments crossing the dateline
+
+    A segment whose ends are more than 180 degrees apart is crossing the
+    dateline (central_longitude +/- 180); it is replaced by two segments
+    ending at the boundary, at the latitude and value interpolated
+    linearly in longitude. The longitudes must be wrapped around
+    central_longitude.
+
+    Parameters
+    ----------
+    segments: ndarray (nseg, 2, 2)
+    colors, end_colors: ndarray (nseg,)
+        values at the start and at the end of the segments
+
+    Returns
+    -------
+    segments, colors
+        the second part of a split segment follows the first one
+    repeat: ndarray or None
+        index of the input segment of each output segment,
+        None if no segment is split
+    first: ndarray
+        index of the first part of the split segments
+    """
+    lon0, lon1 = segments[:, 0, 0], segments[:, 1, 0]
+    crossing = np.abs(lon1 - lon0) > 180
+    if not crossing.any():
+        return segments, colors, None, np.flatnonzero(crossing)
+    cross = segments[crossing]
+    side = np.sign(cross[:, 0, 0] - central_longitude)
+    boundary = central_longitude + 180 * side
+    frac = (boundary - cross[:, 0, 0]) / \
+        (cross[:, 1, 0] + 360 * side - cross[:, 0, 0])
+    lat = cross[:, 0, 1] + frac * (cross[:, 1, 1] - cross[:, 0, 1])
+    start = colors[crossing]
+    value = start + frac * (end_colors[crossing] - start)
+
+    # each crossing segment is repeated and the copies are cut
+    repeat = np.repeat(np.arange(len(segments)), crossing + 1)
+    first = np.flatnonzero(crossing) + np.arange(crossing.sum())
+    segments = segments[repeat]
+    colors = colors[repeat].astype(np.result_type(colors, value))
+    segments[first, 1, 0] = boundary
+    segments[first, 1, 1] = lat
+    segments[first + 1, 0, 0] = boundary - 360 * side
+    segments[first + 1, 0, 1] = lat
+    colors[first + 1] = value
+    return segments, colors, repeat, first
 
 
 class Mapfigure:
     """
         Class based on Basemap with additional functionality
         such as plot_trajectories
+
+        With cache=True (or a directory or a BackgroundCache) the Basemap
+        is taken from a BackgroundCache instead of being built again.
     """
 
     def __init__(
@@ -129,6 +592,7 @@ class Mapfigure:
         lon=None,
         lat=None,
         basemap=None,
+        cache=None,
         **kwargs
     ):
 
@@ -144,7 +608,11 @@ class Mapfigure:
                 kwargs["urcrnrlat"] = domain[3]
             kwargs["resolution"] = resolution
             kwargs["projection"] = projection
-            self.m = Basemap(**kwargs)
+            cache = get_background_cache(cache)
+            if cache is not None and "ax" not in kwargs:
+                self.m = cache.basemap(**kwargs)
+            else:
+                self.m = Basemap(**kwargs)
         else:
             self.m = basemap
         if lon is not None:
@@ -157,7 +625,8 @@ class Mapfigure:
         return self.m(*args, **kwargs)
 
     def __dir__(self):
-        return self.m.__dir__() + ["drawmap", "plot_traj"]
+        return self.m.__dir__() + ["drawmap", "plot_traj", "plot_density",
+                                   "project", "projection_key"]
 
     def drawmap(
         self,
@@ -186,6 +655,9 @@ class Mapfigure:
     def plot_traj(self, trajs, variable, cmap="Spectral", levels=None, **kwargs):
         """Plot trajectories on a map
 
+        trajs is not modified; its points are projected once per Mapfigure
+        (see project) and reused by the next calls.
+
         Usage:
             m = Mapfigure(domain=[5, 15, 40, 50])
             m.drawmap()
@@ -193,20 +665,75 @@ class Mapfigure:
         """
         if self.ax is None:
             self.ax = subplot()
-        lon, lat = trajs["lon"].copy(), trajs["lat"].copy()
-        lonnanvalues = np.isnan(lon)
-        latnanvalues = np.isnan(lat)
-        x, y = self.m(trajs["lon"], trajs["lat"])
-        # m() does not account for nan values
-        x[lonnanvalues] = np.nan
-        y[latnanvalues] = np.nan
-        trajs["lon"] = x
-        trajs["lat"] = y
-        lc = plot_trajs(self.ax, trajs, variable, cmap=cmap, levels=levels, **kwargs)
-        trajs["lon"] = lon
-        trajs["lat"] = lat
-        return lc
-    
+        values = trajs[variable]
+        segments, colors = self._segments(trajs, values)
+        return _plot_segments(self.ax, segments, colors, values, cmap=cmap,
+                              levels=levels, **kwargs)
+
+    def plot_density(self, trajs, variable=None, bins=100, extent=None,
+                     statistic="mean", cmap="Spectral_r", **kwargs):
+        """Plot the density of trajectories on a grid of the map
+
+        extent is given in map coordinates (default the extent of the
+        trajectories); see plot_density for the other arguments.
+
+        Usage:
+            m = Mapfigure(domain=[-180, 180, -90, 90])
+            m.drawmap()
+            m.plot_density(trajs, bins=(360, 180))
+        """
+        if self.ax is None:
+            self.ax = subplot()
+        values = trajs[variable] if variable else np.broadcast_to(
+            0., np.shape(trajs["lon"]))
+        segments, colors = self._segments(trajs, values)
+        return _plot_density(self.ax, segments,
+                             colors if variable else None, bins=bins,
+                             extent=extent, statistic=statistic, cmap=cmap,
+                             **kwargs)
+
+    def project(self, lon, lat):
+        """Return the map coordinates x, y of lon, lat
+
+        Unlike m(lon, lat), the longitudes are first wrapped around the
+        center of the map and x, y are nan for the missing points and
+        for the points which cannot be projected.
+        """
+        lon, lat = np.asarray(lon, dtype="f8"), np.asarray(lat, dtype="f8")
+        missing = ~(np.isfinite(lon) & np.isfinite(lat))
+        lon = _wrap_longitude(np.where(missing, 0, lon),
+                              self.m.projparams.get("lon_0", 0))
+        x, y = self.m(lon, np.where(missing, 0, lat))
+        x, y = np.array(x, dtype="f8"), np.array(y, dtype="f8")
+        # Basemap returns 1e30 for the points outside of the projection
+        missing |= (np.abs(x) >= 1e30) | (np.abs(y) >= 1e30)
+        x[missing] = np.nan
+        y[missing] = np.nan
+        return x, y
+
+    @property
+    def projection_key(self):
+        """Identifier of the map coordinates (projection and corners)"""
+        return ("basemap", self.m.proj4string, self.m.llcrnrlon,
+                self.m.llcrnrlat, self.m.urcrnrlon, self.m.urcrnrlat)
+
+    def _segments(self, trajs, values):
+        """Return the segments of trajs in map coordinates and their values
+
+        The projected points are kept by trajs (see Tra.project) and
+        reused by the next calls on a map with the same projection and
+        domain; trajs is not modified.
+        """
+        xy = None
+        if hasattr(trajs, "project"):
+            xy = trajs.project(self.project, key=self.projection_key)
+        return _get_segments(
+            trajs["lon"], trajs["lat"], values,
+            central_longitude=self.m.projparams.get("lon_0", 0),
+            projection=self.project, xy=xy)
+
+
+
     
 class CartoFigure:
     """Wrapper to create maps based on cartopy
@@ -217,7 +744,7 @@ class CartoFigure:
     default_resolution = '50m'
 
     def __init__(self, ax, projection=None, extent=None, resolution=None,
-                 left_labels=True, bottom_labels=True, **kwargs):
+                 left_labels=True, bottom_labels=True, cache=None, **kwargs):
         """
 
         Parameters
@@ -234,6 +761,10 @@ class CartoFigure:
             resolution to use for plotting the boundaries;
             default 50m;
             available: 10m, 50m, 110m
+        cache: bool, string or BackgroundCache
+            take the coastlines, borders and land (drawmap) already
+            projected for this projection and extent from a BackgroundCache
+            (True for the default one, or its directory); default None
         kwargs: Keyword arguments
             Keyword arguments to pass to plt.axes
         """
@@ -243,6 +774,7 @@ class CartoFigure:
         self.ax = ax
         self.bottom_labels = bottom_labels
         self.left_labels = left_labels
+        self.cache = get_background_cache(cache)
         # if ax:
         #     self.ax = plt.axes(ax.get_position(), projection=self.projection,
         #                         **kwargs)
@@ -250,12 +782,16 @@ class CartoFigure:
         # else:
         #     self.ax = plt.axes(projection=self.projection, **kwargs)
         self.ax.set_global()                    # setting global axis 
-        self.ax.coastlines(resolution = "50m")  # add coastlines outlines to the current axis
-        self.ax.add_feature(cfeature.BORDERS, edgecolor="black", linewidth = 0.3) #adding country boarder lines
-        
-        
+        # the extent is set first, the cached features depend on it
         if self.extent is not None:
             self.ax.set_extent(self.extent, self.projection)
+        # add coastlines outlines to the current axis
+        add_feature(self.ax, cfeature.COASTLINE.with_scale("50m"),
+                    cache=self.cache, edgecolor="black", facecolor="none")
+        # adding country boarder lines
+        add_feature(self.ax, cfeature.BORDERS, cache=self.cache,
+                    edgecolor="black", linewidth=0.3)
+
         self.gl= self.ax.gridlines(crs=self.projection, draw_labels=True, linewidth=1, edgecolor="gray", linestyle="--", color="gray", alpha=0.5)
         
         self.gl.top_labels =False
@@ -280,7 +816,7 @@ class CartoFigure:
     #     return getattr(self.ax, item)
 
     def __dir__(self):
-        return self.ax.__dir__() + ['drawmap', 'plot_trajs']
+        return self.ax.__dir__() + ['drawmap', 'plot_trajs', 'plot_density']
 
     def drawmap(self):
         """Draw the land feature
@@ -290,7 +826,7 @@ class CartoFigure:
         land = cfeature.NaturalEarthFeature('cultural', 'admin_0_countries',
                                             self.resolution, edgecolor='gray',
                                             facecolor='none', linewidth=0.5)
-        self.ax.add_feature(land)
+        add_feature(self.ax, land, cache=self.cache)
     
 
     def plot_trajs(self, trajs, variable='', **kwargs):
@@ -299,4 +835,6 @@ class CartoFigure:
         kwargs['variable'] = variable
         return plot_trajs(self.ax, trajs, **kwargs)
 
-
+    def plot_density(self, trajs, variable=None, **kwargs):
+        """Plot the density of trajectories on the map (see plot_density)"""
+        return plot_density(self.ax, trajs, variable=variable, **kwargs)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Temporal resampling of trajectories
+
+The variables of all the trajectories are interpolated at once onto a
+new time axis: linearly for the scalars and along the great circle for
+lon/lat. The time axes are expressed in hours relative to the first time
+step (0, 1, 2, ... for forward and 0, -1, -2, ... for backward
+trajectories) so that trajectories starting at different dates and with
+different output intervals can be put on a common axis and concatenated.
+Times which are not datetime64 (usedatetime=False, or the times argument)
+are LAGRANTO hh.mm (-1.30 is an hour and a half before the start).
+"""
+import numpy as np
+
+from .traj_storage import ColumnarArray
+from .traj_time import frac_to_hhmm, hhmm_to_frac
+
+
+def relative_hours(times):
+    """Return times (datetime64 or hh.mm) in hours since the first one"""
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return (times - times[0]) / np.timedelta64(1, 'h')
+    hours = hhmm_to_frac(times)
+    return hours - hours[0]
+
+
+def time_axis(times, step):
+    """Return the relative hours from 0 to the end of times every step"""
+    hours = relative_hours(times)
+    end = hours[-1] if len(hours) else 0
+    count = int(np.floor(abs(end) / step + 1e-9)) + 1
+    return np.arange(count) * step * (-1 if end < 0 else 1)
+
+
+def interpolation_weights(source, target):
+    """ Return before, after, weight to interpolate from source to target
+
+    source and target are hours, source is sorted in ascending or
+    descending order; value = v[before] * (1 - weight) + v[after] * weight.
+    weight is nan for the targets outside of source.
+    """
+    source = np.asarray(source, dtype='f8')
+    target = np.asarray(target, dtype='f8')
+    if len(source) > 1 and source[-1] < source[0]:
+        source, target = -source, -target
+    # tolerance for the hours computed from hh.mm or seconds
+    tolerance = 1e-9 * max(1, np.abs(source).max(initial=0))
+    last = len(source) - 1
+    after = np.clip(np.searchsorted(source, target, side='right'), 0, last)
+    before = np.clip(after - 1, 0, last)
+    span = source[after] - source[before]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(span > 0, (target - source[before]) / span, 0.)
+    weight = np.clip(weight, 0, 1)
+    # the last time step: use the exact value
+    end = weight == 1
+    before[end], weight[end] = after[end], 0
+    outside = (target < source[0] - tolerance) | \
+        (target > source[-1] + tolerance)
+    weight[outside] = np.nan
+    return before, after, weight
+
+
+def resample(array, times=None, step=None, chunksize=5000):
+    """ Return the trajectories interpolated on a new time axis
+
+    Parameters
+    ----------
+    array: structured or columnar array (ntra, ntime)
+    times: array_like, optional
+        new times, datetime64 or hh.mm relative to the first time step
+    step: float, optional
+        new output interval in hours (from the first to the last time
+        step), used if times is not given
+    chunksize: int, default 5000
+        number of trajectories interpolated at once
+
+    Returns
+    -------
+    structured or columnar array (ntra, len(times)); nan (NaT for the
+    dates) outside of the times of array, the integer variables are then
+    converted to float
+    """
+    source = np.asarray(array['time'][0])
+    if times is None:
+        if step is None:
+            raise ValueError('times or step is required')
+        target = time_axis(source, step)
+    elif np.issubdtype(np.asarray(times).dtype, np.datetime64):
+        target = (np.asarray(times) - source[0]) / np.timedelta64(1, 'h')
+    else:
+        target = hhmm_to_frac(times)
+    before, after, weight = interpolation_weights(relative_hours(source),
+                                                  target)
+    names = array.dtype.names
+    shape = (len(array), len(target))
+    outside = np.isnan(weight).any()
+    dtypes = [(name, 'f8' if outside and array.dtype[name].kind in 'biu'
+               else array.dtype[name]) for name in names]
+    if isinstance(array, ColumnarArray):
+        newarray = ColumnarArray([(name, np.empty(shape, dtype))
+                                  for name, dtype in dtypes], shape=shape)
+    else:
+        newarray = np.empty(shape, dtype=dtypes)
+    newarray['time'] = _new_times(source, target)
+    positions = 'lon' in names and 'lat' in names
+    for start in range(0, shape[0], chunksize):
+        rows = slice(start, start + chunksize)
+        if positions:
+            newarray['lon'][rows], newarray['lat'][rows] = _slerp(
+                np.asarray(array['lon'][rows]),
+                np.asarray(array['lat'][rows]), before, after, weight)
+        for name in names:
+            if name == 'time' or (positions and name in ('lon', 'lat')):
+                continue
+            newarray[name][rows] = _interpolate(
+                np.asarray(array[name][rows]), before, after, weight)
+    return newarray
+
+
+def align_trajs(trajs, times=None, step=None):
+    """ Resample trajectories on a common relative time axis
+
+    Parameters
+    ----------
+    trajs: list of Tra
+    times: array_like, optional
+        hh.mm relative to the first time step of each Tra
+    step: float, optional
+        output interval in hours; by default the largest interval of
+        trajs, over the hours covered by all of them
+
+    Returns
+    -------
+    list of Tra, with the same number of time steps
+
+    Examples
+    --------
+
+    >>> hourly, three_hourly = Tra('lsl_1h.4'), Tra('lsl_3h.4')
+    >>> merged = hourly.concatenate(three_hourly, align=True)
+    """
+    hours = [relative_hours(tra['time'][0]) for tra in trajs]
+    if times is None:
+        if step is None:
+            step = max(np.abs(np.diff(hour)).max(initial=0)
+                       for hour in hours)
+        if step <= 0:
+            raise ValueError('the trajectories have a single time step')
+        shortest = min(range(len(trajs)), key=lambda i: abs(hours[i][-1]))
+        times = frac_to_hhmm(time_axis(trajs[shortest]['time'][0], step))
+    return [tra.resample(times=times) for tra in trajs]
+
+
+def _new_times(source, target):
+    """Return the times target (hours) in the format of source (datetime64
+    or hh.mm)"""
+    if np.issubdtype(source.dtype, np.datetime64):
+        seconds = np.around(target * 3600).astype('timedelta64[s]')
+        return (source[0] + seconds).astype(source.dtype)
+    hours = hhmm_to_frac(source[0]) + target
+    return frac_to_hhmm(hours).astype(source.dtype)
+
+
+def _interpolate(values, before, after, weight):
+    """Linear interpolation of values (ntra, ntime) along the time axis"""
+    if not np.issubdtype(values.dtype, np.floating):
+        # nearest time step for the non float variables, missing outside
+        nearest = np.where(np.nan_to_num(weight) < 0.5, before, after)
+        result = values[:, nearest]
+        outside = np.isnan(weight)
+        if not outside.any():
+            return result
+        if values.dtype.kind in 'mM':
+            result[:, outside] = values.dtype.type('NaT')
+        elif values.dtype.kind in 'biu':
+            result = result.astype('f8')
+            result[:, outside] = np.nan
+        return result
+    result = values[:, before] * (1 - weight) + values[:, after] * weight
+    # keep the exact values at the existing time steps
+    exact = weight == 0
+    result[:, exact] = values[:, before[exact]]
+    return result.astype(values.dtype)
+
+
+def _slerp(lon, lat, before, after, weight):
+    """ Interpolation of lon, lat (degrees) along the great circle
+
+    The new longitudes are wrapped within 180 degrees of the previous
+    position, so they keep the convention of lon (e.g. 0..360), and into
+    [-180, 180) for the trajectories whose longitudes are all in
+    [-180, 180].
+    """
+    lon, lat = np.asarray(lon), np.asarray(lat)
+    newlon = np.empty(lon.shape[:1] + weight.shape, dtype=lon.dtype)
+    newlat = np.empty(lat.shape[:1] + weight.shape, dtype=lat.dtype)
+    exact = (weight == 0) | np.isnan(weight)
+    newlon[:, exact] = np.where(np.isnan(weight[exact]), np.nan,
+                                lon[:, before[exact]])
+    newlat[:, exact] = np.where(np.isnan(weight[exact]), np.nan,
+                                lat[:, before[exact]])
+    inside = ~exact
+    if not inside.any():
+        return newlon, newlat
+    before, after, weight = before[inside], after[inside], weight[inside]
+    # unit vectors of the existing positions, gathered for each new time
+    radlon, radlat = np.radians(lon), np.radians(lat)
+    xyz = np.stack([np.cos(radlat) * np.cos(radlon),
+                    np.cos(radlat) * np.sin(radlon), np.sin(radlat)])
+    xyz0, xyz1 = xyz[:, :, before], xyz[:, :, after]
+    angle = np.arccos(np.clip((xyz0 * xyz1).sum(axis=0), -1, 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sine = np.sin(angle)
+        small = sine < 1e-12
+        coef0 = np.where(small, 1 - weight,
+                         np.sin((1 - weight) * angle) / sine)
+        coef1 = np.where(small, weight, np.sin(weight * angle) / sine)
+    xyz0 *= coef0
+    xyz1 *= coef1
+    xyz0 += xyz1
+    lon0 = lon[:, before]
+    lon1 = lon0 + (np.degrees(np.arctan2(xyz0[1], xyz0[0])) - lon0 +
+                   180) % 360 - 180
+    standard = ((np.abs(lon) <= 180) | np.isnan(lon)).all(axis=1)
+    lon1[standard] = (lon1[standard] + 180) % 360 - 180
+    newlon[:, inside] = lon1
+    newlat[:, inside] = np.degrees(np.arcsin(np.clip(xyz0[2], -1, 1)))
+    return newlon, newlat
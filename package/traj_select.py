@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Selection of trajectories (LAGRANTO-style criteria)
+
+A criterion returns a boolean mask over the trajectories computed with
+array operations on the whole ensemble (by chunks of trajectories);
+criteria are combined with & (and), | (or) and ~ (not).
+
+Examples
+--------
+
+Warm conveyor belt: ascent of more than 600 hPa within 48 h, starting
+below 800 hPa in the box [-80, -20, 25, 50]
+
+>>> wcb = Fall('p', 600, hours=48) & Value('p', above=800) & \\
+...     InBox(-80, -20, 25, 50)
+>>> idx = trajs.select(wcb)
+>>> wcb_trajs = Tra(array=trajs[idx])
+"""
+import warnings
+
+import numpy as np
+
+from .traj_geo import in_polygon, wrap_longitude
+from .traj_index import _lon_range
+from .traj_time import hhmm_to_frac
+
+
+class Criterion(object):
+    """ Base class of the criteria
+
+    Subclasses implement mask(columns), columns giving the variables of
+    a chunk of trajectories (see Columns).
+    """
+
+    def mask(self, columns):
+        raise NotImplementedError
+
+    def select(self, trajs, chunksize=100000):
+        """ Return the indices of the trajectories matching the criterion
+
+        Parameters
+        ----------
+        trajs: Tra or structured array (ntra, ntime)
+        chunksize: int, default 100000
+            number of trajectories evaluated at once, limits the memory
+            used by the temporary arrays
+
+        Returns
+        -------
+        ndarray of int, sorted trajectory indices
+        """
+        ntra = len(trajs['time'])
+        masks = [self.mask(Columns(trajs, slice(start, start + chunksize)))
+                 for start in range(0, ntra, chunksize)]
+        if not masks:
+            return np.zeros(0, dtype=int)
+        return np.flatnonzero(np.concatenate(masks))
+
+    def __and__(self, other):
+        return All(self, other)
+
+    def __or__(self, other):
+        return Any(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class All(Criterion):
+    """Trajectories matching all the criteria"""
+
+    def __init__(self, *criteria):
+        self.criteria = criteria
+
+    def __repr__(self):
+        return '({})'.format(' & '.join(repr(c) for c in self.criteria))
+
+    def mask(self, columns):
+        mask = self.criteria[0].mask(columns)
+        for criterion in self.criteria[1:]:
+            mask &= criterion.mask(columns)
+        return mask
+
+
+class Any(Criterion):
+    """Trajectories matching at least one of the criteria"""
+
+    def __init__(self, *criteria):
+        self.criteria = criteria
+
+    def __repr__(self):
+        return '({})'.format(' | '.join(repr(c) for c in self.criteria))
+
+    def mask(self, columns):
+        mask = self.criteria[0].mask(columns)
+        for criterion in self.criteria[1:]:
+            mask |= criterion.mask(columns)
+        return mask
+
+
+class Not(Criterion):
+    """Trajectories not matching criterion"""
+
+    def __init__(self, criterion):
+        self.criterion = criterion
+
+    def __repr__(self):
+        return '~{!r}'.format(self.criterion)
+
+    def mask(self, columns):
+        return ~self.criterion.mask(columns)
+
+
+class Rise(Criterion):
+    """ Increase of variable by at least value within hours
+
+    The increase is measured forward in time (from an earlier to a later
+    time step) for forward and backward trajectories.
+
+    Parameters
+    ----------
+    variable: string
+    value: float
+    hours: float, optional
+        length of the window, default the whole trajectory
+    """
+
+    sign = 1
+
+    def __init__(self, variable, value, hours=None):
+        self.variable = variable
+        self.value = value
+        self.hours = hours
+
+    def __repr__(self):
+        return '{}({!r}, {}, hours={})'.format(
+            type(self).__name__, self.variable, self.value, self.hours)
+
+    def mask(self, columns):
+        values = self.sign * columns.forward(self.variable)
+        hours = columns.forward_hours()
+        steps = len(hours) - 1
+        if self.hours is not None and len(hours) > 1:
+            interval = np.diff(hours)
+            if not np.allclose(interval, interval[0]):
+                raise ValueError('the time steps must be regular')
+            steps = min(int(np.floor(self.hours / interval[0] + 1e-6)),
+                        steps)
+        lowest = _running_min(values, steps + 1)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            change = np.fmax.reduce(values - lowest, axis=1)
+        return change >= self.value
+
+
+class Fall(Rise):
+    """ Decrease of variable by at least value within hours
+
+    e.g. Fall('p', 600, hours=48) for an ascent of 600 hPa in 48 h;
+    see Rise.
+    """
+
+    sign = -1
+
+
+class Value(Criterion):
+    """ Value of variable at a time between above and below (included)
+
+    Parameters
+    ----------
+    variable: string
+    at: 'first', 'last' or a time, default 'first'
+        time step of the value; first and last refer to the order of the
+        file (first is the starting time of backward trajectories)
+    above, below: float, optional
+    """
+
+    def __init__(self, variable, at='first', above=None, below=None):
+        self.variable = variable
+        self.at = at
+        self.above = above
+        self.below = below
+
+    def __repr__(self):
+        return 'Value({!r}, at={!r}, above={}, below={})'.format(
+            self.variable, self.at, self.above, self.below)
+
+    def mask(self, columns):
+        values = columns[self.variable][:, columns.timestep(self.at)]
+        return _between(values, self.above, self.below)
+
+
+class Statistic(Criterion):
+    """ Statistic of variable over a time window between above and below
+
+    Parameters
+    ----------
+    variable: string
+    statistic: 'min', 'max' or 'mean'
+    above, below: float, optional
+    start, end: time, optional
+        window of the statistic, start <= time <= end; default all times
+        (a ValueError is raised if the window contains no time step)
+
+    Missing values (nan) are ignored.
+    """
+
+    functions = {'min': np.fmin.reduce, 'max': np.fmax.reduce,
+                 'mean': np.nanmean}
+
+    def __init__(self, variable, statistic, above=None, below=None,
+                 start=None, end=None):
+        if statistic not in self.functions:
+            raise ValueError('statistic must be one of ({})'.format(
+                ', '.join(self.functions)))
+        self.variable = variable
+        self.statistic = statistic
+        self.above = above
+        self.below = below
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return 'Statistic({!r}, {!r}, above={}, below={})'.format(
+            self.variable, self.statistic, self.above, self.below)
+
+    def mask(self, columns):
+        window = columns.window(self.start, self.end)
+        if not window.any():
+            raise ValueError('no time step between start={} and end={} for '
+                             '{!r}'.format(self.start, self.end, self))
+        values = columns[self.variable][:, window]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            values = self.functions[self.statistic](values, axis=1)
+        return _between(values, self.above, self.below)
+
+
+class InBox(Criterion):
+    """ Position at a time inside a lon/lat box
+
+    Parameters
+    ----------
+    lonmin, lonmax, latmin, latmax: float
+        limits of the box in degrees, lonmin > lonmax for a box crossing
+        the dateline
+    at: 'first', 'last' or a time, default 'first'
+    """
+
+    def __init__(self, lonmin, lonmax, latmin, latmax, at='first'):
+        self.box = (lonmin, lonmax, latmin, latmax)
+        self.at = at
+
+    def __repr__(self):
+        return 'InBox({}, {}, {}, {}, at={!r})'.format(*self.box, self.at)
+
+    def mask(self, columns):
+        step = columns.timestep(self.at)
+        lon = wrap_longitude(columns['lon'][:, step])
+        lat = columns['lat'][:, step]
+        lonmin, lonmax = _lon_range(*self.box[:2])
+        if lonmin <= lonmax:
+            inside = (lon >= lonmin) & (lon <= lonmax)
+        else:
+            inside = (lon >= lonmin) | (lon <= lonmax)
+        return inside & (lat >= self.box[2]) & (lat <= self.box[3])
+
+
+class InPolygon(Criterion):
+    """ Position at a time inside a polygon
+
+    Parameters
+    ----------
+    lon, lat: array_like
+        vertices of the polygon in degrees (between -180 and 180,
+        not crossing the dateline)
+    at: 'first', 'last' or a time, default 'first'
+    """
+
+    def __init__(self, lon, lat, at='first'):
+        self.lon = np.asarray(lon, dtype='f8')
+        self.lat = np.asarray(lat, dtype='f8')
+        self.at = at
+
+    def __repr__(self):
+        return 'InPolygon({} vertices, at={!r})'.format(len(self.lon),
+                                                       self.at)
+
+    def mask(self, columns):
+        step = columns.timestep(self.at)
+        return in_polygon(wrap_longitude(columns['lon'][:, step]),
+                          columns['lat'][:, step], self.lon, self.lat)
+
+
+class Columns(object):
+    """ Variables of the trajectories rows of trajs, read once
+
+    Parameters
+    ----------
+    trajs: Tra or structured array (ntra, ntime)
+    rows: slice
+    """
+
+    def __init__(self, trajs, rows=slice(None)):
+        self.trajs = trajs
+        self.rows = rows
+        self.times = np.asarray(trajs['time'][0])
+        self._columns = {}
+
+    def __getitem__(self, variable):
+        if variable not in self._columns:
+            self._columns[variable] = np.asarray(
+                self.trajs[variable][self.rows], dtype='f8')
+        return self._columns[variable]
+
+    @property
+    def backward(self):
+        return len(self.times) > 1 and self.times[-1] < self.times[0]
+
+    def hours(self):
+        """Return the times in hours (from datetime64 or hh.mm)"""
+        if np.issubdtype(self.times.dtype, np.datetime64):
+            return (self.times - self.times[0]) / np.timedelta64(1, 'h')
+        return hhmm_to_frac(self.times)
+
+    def forward(self, variable):
+        """Return variable with the time steps sorted forward in time"""
+        return self[variable][:, ::-1] if self.backward else self[variable]
+
+    def forward_hours(self):
+        hours = self.hours()
+        return hours[::-1] if self.backward else hours
+
+    def timestep(self, at):
+        """Return the time step of at ('first', 'last' or a time)"""
+        if isinstance(at, str) and at in ('first', 'last'):
+            return 0 if at == 'first' else len(self.times) - 1
+        found = np.flatnonzero(self.times ==
+                               np.asarray(at).astype(self.times.dtype))
+        if found.size == 0:
+            raise ValueError('{} not found in time'.format(at))
+        return found[0]
+
+    def window(self, start=None, end=None):
+        """Return the time steps with start <= time <= end"""
+        allowed = np.ones(len(self.times), dtype=bool)
+        if start is not None:
+            allowed &= self.times >= np.asarray(start).astype(
+                self.times.dtype)
+        if end is not None:
+            allowed &= self.times <= np.asarray(end).astype(self.times.dtype)
+        return allowed
+
+
+def _running_min(values, length):
+    """Return the min of values[:, j - length + 1:j + 1] for each j (nan are
+    ignored)
+    """
+    result = values.copy()
+    span = 1
+    while span < length:
+        shift = min(span, length - span)
+        result[:, shift:] = np.fmin(result[:, shift:], result[:, :-shift])
+        span += shift
+    return result
+
+
+def _between(values, above=None, below=None):
+    """Return above <= values <= below (False for nan)"""
+    mask = np.isfinite(values)
+    if above is not None:
+        mask &= values >= above
+    if below is not None:
+        mask &= values <= below
+    return mask
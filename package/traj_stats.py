@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming statistics of trajectory ensembles
+
+EnsembleStats accumulates, for each variable and time step, the running
+moments (count, mean, variance, min, max) and a quantile sketch of the
+trajectories it is given, one Tra or file at a time; the memory used does
+not depend on the number of trajectories. Partial statistics computed
+separately (e.g. in worker processes) are combined with merge.
+"""
+import os
+from multiprocessing.pool import Pool
+
+import numpy as np
+
+from .traj import Tra
+from .traj_utils import detect_format
+
+
+class RunningMoments(object):
+    """ Count, mean, variance, min and max of batches of values
+
+    The moments of each batch are combined with the running ones with the
+    parallel form of Welford's algorithm (Chan et al.); missing values
+    (nan) are ignored.
+
+    Parameters
+    ----------
+    size: int
+        number of statistics kept (one per time step)
+    """
+
+    def __init__(self, size):
+        self.count = np.zeros(size, dtype='i8')
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+
+    def add(self, values):
+        """Add values (n, size)"""
+        values = np.asarray(values, dtype='f8')
+        valid = np.isfinite(values)
+        count = valid.sum(axis=0)
+        filled = np.where(valid, values, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = filled.sum(axis=0) / count
+            m2 = (np.where(valid, values - mean, 0) ** 2).sum(axis=0)
+        self._combine(count, np.nan_to_num(mean), m2)
+        self.min = np.fmin(self.min, np.fmin.reduce(values, axis=0))
+        self.max = np.fmax(self.max, np.fmax.reduce(values, axis=0))
+
+    def merge(self, other):
+        """Add the values accumulated by other"""
+        self._combine(other.count, other.mean, other.m2)
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = mean - self.mean
+            self.mean = np.where(total > 0,
+                                 self.mean + delta * count / total, 0)
+            self.m2 = np.where(total > 0, self.m2 + m2 +
+                               delta ** 2 * self.count * count / total, 0)
+        self.count = total
+
+    def variance(self, ddof=0):
+        """Return the variance (nan where count <= ddof)"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof,
+                            self.m2 / (self.count - ddof), np.nan)
+
+
+class QuantileSketch(object):
+    """ Mergeable quantile sketch with a relative accuracy
+
+    Values are counted in logarithmic buckets (as in DDSketch): a value x
+    falls in the bucket k = ceil(log(|x|) / log(gamma)),
+    gamma = (1 + accuracy) / (1 - accuracy), so a quantile is estimated
+    within accuracy * |x|. The counts of two sketches are simply added;
+    the number of buckets only depends on the range of the values.
+
+    Parameters
+    ----------
+    size: int
+        number of sketches kept (one per time step)
+    accuracy: float, default 0.01
+        relative accuracy of the quantiles
+    min_value: float, default 1e-9
+        values with |x| < min_value are counted as 0
+    """
+
+    def __init__(self, size, accuracy=0.01, min_value=1e-9):
+        self.accuracy = accuracy
+        self.min_value = min_value
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.zeros = np.zeros(size, dtype='i8')
+        # counts of the buckets offset, offset + 1, ... of x > 0 and x < 0
+        self.positive = _Buckets(size)
+        self.negative = _Buckets(size)
+
+    @property
+    def size(self):
+        return len(self.zeros)
+
+    def _key(self, values):
+        return np.ceil(np.log(values) / np.log(self.gamma)).astype('i8')
+
+    def add(self, values):
+        """Add values (n, size)"""
+        values = np.asarray(values, dtype='f8')
+        step = np.broadcast_to(np.arange(self.size), values.shape)
+        valid = np.isfinite(values)
+        values, step = values[valid], step[valid]
+        small = np.abs(values) < self.min_value
+        self.zeros += np.bincount(step[small], minlength=self.size)
+        for buckets, sign in ((self.positive, 1), (self.negative, -1)):
+            selected = (sign * values >= self.min_value)
+            buckets.add(step[selected], self._key(sign * values[selected]))
+
+    def merge(self, other):
+        """Add the values counted by other"""
+        if other.gamma != self.gamma:
+            raise ValueError('the sketches must have the same accuracy')
+        self.zeros += other.zeros
+        self.positive.merge(other.positive)
+        self.negative.merge(other.negative)
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        """ Return the q quantile(s) of each sketch
+
+        Parameters
+        ----------
+        q: float or sequence of float in [0, 1]
+
+        Returns
+        -------
+        ndarray (size,) or (len(q), size), nan for empty sketches
+        """
+        # all the buckets sorted by value: negative (decreasing key),
+        # zero, positive (increasing key)
+        counts = np.concatenate([self.negative.counts[:, ::-1],
+                                 self.zeros[:, None],
+                                 self.positive.counts], axis=1)
+        values = np.concatenate([
+            -self._value(self.negative.keys()[::-1]), [0.],
+            self._value(self.positive.keys())])
+        cumulative = np.cumsum(counts, axis=1)
+        total = cumulative[:, -1]
+        quantiles = np.atleast_1d(np.asarray(q, dtype='f8'))
+        if ((quantiles < 0) | (quantiles > 1)).any():
+            raise ValueError('quantiles must be in [0, 1]')
+        result = np.full((len(quantiles), self.size), np.nan)
+        for i, quantile in enumerate(quantiles):
+            rank = quantile * (total - 1)
+            position = (cumulative > rank[:, None]).argmax(axis=1)
+            result[i] = np.where(total > 0, values[position], np.nan)
+        return result[0] if np.ndim(q) == 0 else result
+
+
+class _Buckets(object):
+    """Dense counts (size, nkeys) of the keys offset ... offset + nkeys - 1"""
+
+    def __init__(self, size):
+        self.offset = 0
+        self.counts = np.zeros((size, 0), dtype='i8')
+
+    def keys(self):
+        return np.arange(self.offset, self.offset + self.counts.shape[1])
+
+    def _extend(self, low, high):
+        """Make room for the keys low ... high"""
+        if self.counts.shape[1] == 0:
+            self.offset = low
+            self.counts = np.zeros((len(self.counts), high - low + 1),
+                                   dtype='i8')
+            return
+        before = max(self.offset - low, 0)
+        after = max(high - (self.offset + self.counts.shape[1] - 1), 0)
+        if before or after:
+            self.counts = np.pad(self.counts, ((0, 0), (before, after)))
+            self.offset -= before
+
+    def add(self, step, key):
+        if len(key) == 0:
+            return
+        self._extend(key.min(), key.max())
+        nkeys = self.counts.shape[1]
+        self.counts += np.bincount(
+            step * nkeys + (key - self.offset),
+            minlength=self.counts.size).reshape(self.counts.shape)
+
+    def merge(self, other):
+        if other.counts.shape[1] == 0:
+            return
+        self._extend(other.offset, other.offset + other.counts.shape[1] - 1)
+        start = other.offset - self.offset
+        self.counts[:, start:start + other.counts.shape[1]] += other.counts
+
+
+class EnsembleStats(object):
+    """ Per time step statistics of trajectories, accumulated one file at
+    a time
+
+    Parameters
+    ----------
+    variables: list of string, optional
+        variables to accumulate, default all the variables of the first
+        trajectories added except time
+    accuracy: float, default 0.01
+        relative accuracy of the quantiles (see QuantileSketch)
+    kwargs: dict
+        arguments passed to Tra(filename, **kwargs) to load the files
+        (netcdf files are read lazily, only the variables used are read)
+
+    Examples
+    --------
+
+    >>> stats = EnsembleStats(['p', 'q'])
+    >>> for filename in glob('June/Trace/Munich/wcb_*.1'):
+    ...     stats.add(filename)
+    >>> stats.mean('p'), stats.std('p'), stats.quantile('p', [0.1, 0.9])
+
+    Statistics of several groups computed in worker processes
+
+    >>> stats = EnsembleStats.from_files('*/Trace/Munich/wcb_*.1',
+    ...                                  variables=['p'], processes=4)
+    """
+
+    def __init__(self, variables=None, accuracy=0.01, **kwargs):
+        self.variables = None if variables is None else list(variables)
+        self.accuracy = accuracy
+        self.kwargs = kwargs
+        self.ntime = None
+        self.ntra = 0
+        self._moments = {}
+        self._sketches = {}
+
+    def __repr__(self):
+        return 'EnsembleStats({} trajectories, variables={})'.format(
+            self.ntra, self.variables)
+
+    def _setup(self, variables, ntime):
+        if self.variables is None:
+            self.variables = [var for var in variables if var != 'time']
+        if self.ntime is None:
+            self.ntime = ntime
+            for var in self.variables:
+                self._moments[var] = RunningMoments(ntime)
+                self._sketches[var] = QuantileSketch(ntime, self.accuracy)
+        elif ntime != self.ntime:
+            raise ValueError('the trajectories have {} timesteps instead of '
+                             '{}'.format(ntime, self.ntime))
+
+    def add(self, trajs):
+        """ Add trajectories
+
+        Parameters
+        ----------
+        trajs: Tra, structured array (ntra, ntime) or filename
+        """
+        if isinstance(trajs, (str, os.PathLike)):
+            kwargs = dict(self.kwargs)
+            if detect_format(str(trajs)) == 'netcdf':
+                kwargs.setdefault('lazy', True)
+            loaded = Tra(str(trajs), **kwargs)
+            try:
+                self.add(loaded)
+            finally:
+                loaded.close()
+            return self
+        self._setup(trajs.dtype.names, trajs.shape[1])
+        for var in self.variables:
+            values = trajs[var]
+            self._moments[var].add(values)
+            self._sketches[var].add(values)
+        self.ntra += trajs.shape[0]
+        return self
+
+    def update(self, items):
+        """Add each Tra, array or filename of items"""
+        for trajs in items:
+            self.add(trajs)
+        return self
+
+    def merge(self, other):
+        """Add the statistics accumulated by other (same variables)"""
+        if other.ntime is None:
+            return self
+        self._setup(other.variables, other.ntime)
+        if other.variables != self.variables:
+            raise ValueError('the statistics must have the same variables')
+        for var in self.variables:
+            self._moments[var].merge(other._moments[var])
+            self._sketches[var].merge(other._sketches[var])
+        self.ntra += other.ntra
+        return self
+
+    @classmethod
+    def from_files(cls, files, processes=1, variables=None, accuracy=0.01,
+                   **kwargs):
+        """ Return the statistics of the trajectories of files
+
+        Each of the `processes` workers accumulates the statistics of a
+        part of the files; the partial statistics are then merged.
+
+        Parameters
+        ----------
+        files: list of string
+        processes: int, default 1
+            Number of worker processes; None use all the cores
+        variables, accuracy, kwargs:
+            see EnsembleStats
+        """
+        files = [str(f) for f in files]
+        if processes == 1 or len(files) < 2:
+            return cls(variables, accuracy, **kwargs).update(files)
+        processes = processes or os.cpu_count()
+        groups = [files[i::processes] for i in range(processes)]
+        tasks = [(group, variables, accuracy, kwargs)
+                 for group in groups if group]
+        with Pool(len(tasks)) as pool:
+            partials = pool.map(_stats_of_files, tasks)
+        stats = partials[0]
+        for partial in partials[1:]:
+            stats.merge(partial)
+        return stats
+
+    def _get(self, variable):
+        if variable not in self._moments:
+            raise ValueError('no statistics for {}'.format(variable))
+        return self._moments[variable]
+
+    def count(self, variable):
+        """Return the number of valid values at each time step"""
+        return self._get(variable).count
+
+    def mean(self, variable):
+        """Return the mean at each time step"""
+        moments = self._get(variable)
+        return np.where(moments.count > 0, moments.mean, np.nan)
+
+    def var(self, variable, ddof=0):
+        """Return the variance at each time step"""
+        return self._get(variable).variance(ddof)
+
+    def std(self, variable, ddof=0):
+        """Return the standard deviation at each time step"""
+        return np.sqrt(self.var(variable, ddof))
+
+    def min(self, variable):
+        """Return the minimum at each time step"""
+        moments = self._get(variable)
+        return np.where(moments.count > 0, moments.min, np.nan)
+
+    def max(self, variable):
+        """Return the maximum at each time step"""
+        moments = self._get(variable)
+        return np.where(moments.count > 0, moments.max, np.nan)
+
+    def quantile(self, variable, q):
+        """ Return the q quantile(s) at each time step
+
+        Estimated within the relative accuracy of the statistics; shape
+        (ntime,) for a single q or (len(q), ntime).
+        """
+        self._get(variable)
+        quantiles = self._sketches[variable].quantile(q)
+        return np.clip(quantiles, self.min(variable), self.max(variable))
+
+
+def _stats_of_files(task):
+    """Return the EnsembleStats of a list of files (run by the workers)"""
+    files, variables, accuracy, kwargs = task
+    return EnsembleStats(variables, accuracy, **kwargs).update(files)
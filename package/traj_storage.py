@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Storage of the trajectories
+
+ColumnarArray keeps each variable in its own contiguous (ntra, ntime) array
+and behaves like the structured array used by Tra for the access by
+variable name, dtype and shape.
+append_to_buffer is used to append along the trajectory or time axis with
+spare capacity.
+"""
+import numpy as np
+
+
+class ColumnarArray(object):
+    """ Trajectories stored as one array per variable
+
+    Adding (trajs['new'] = values) or removing (del trajs['new']) a
+    variable does not copy the other variables, and reductions over a
+    variable go through contiguous memory.
+
+    Parameters
+    ----------
+    columns: dict
+        variable name -> array; all arrays must have the same shape
+    shape: tuple, optional
+        shape of the trajectories, needed if columns is empty
+
+    Examples
+    --------
+
+    >>> columns = ColumnarArray.from_array(structured_array)
+    >>> columns['lon']
+    >>> columns['dp'] = columns['p'] - columns['p'][:, :1]
+    >>> structured_array = columns.to_array()
+    """
+
+    def __init__(self, columns=None, shape=None):
+        columns = dict(columns) if columns else {}
+        if shape is None:
+            if not columns:
+                raise ValueError('shape is required without columns')
+            shape = next(iter(columns.values())).shape
+        self.shape = tuple(shape)
+        self._formats = {}
+        self._columns = {}
+        self._buffers = {}
+        for name, column in columns.items():
+            column = np.asarray(column)
+            if column.shape != self.shape:
+                raise ValueError('{} has the shape {} instead of '
+                                 '{}'.format(name, column.shape, self.shape))
+            self._formats[name] = column.dtype
+            self._columns[name] = np.ascontiguousarray(column)
+
+    @classmethod
+    def from_array(cls, array):
+        """Create a ColumnarArray from a structured array"""
+        return cls([(name, np.array(array[name]))
+                    for name in array.dtype.names], shape=array.shape)
+
+    @classmethod
+    def concatenate(cls, arrays, axis=0):
+        """Concatenate structured or columnar arrays along axis"""
+        names = arrays[0].dtype.names
+        return cls([(name, np.concatenate([array[name] for array in arrays],
+                                          axis=axis))
+                    for name in names])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        array = self.to_array()
+        return array.astype(dtype) if dtype else array
+
+    def __contains__(self, name):
+        return name in self._formats
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._formats:
+                raise ValueError('no field of name {}'.format(key))
+            if key not in self._columns:
+                self._columns[key] = self._load(key)
+            return self._columns[key]
+        if isinstance(key, list) and key and isinstance(key[0], str):
+            return ColumnarArray([(name, self[name]) for name in key],
+                                 shape=self.shape)
+        columns = [(name, self[name][key]) for name in self._formats]
+        if columns:
+            shape = columns[0][1].shape
+        else:
+            shape = np.broadcast_to(0, self.shape)[key].shape
+        return ColumnarArray(columns, shape=shape)
+
+    def __setitem__(self, key, item):
+        if isinstance(key, str):
+            if key in self._formats:
+                self[key][...] = item
+                return
+            item = np.asarray(item)
+            self._formats[key] = item.dtype
+            self._columns[key] = np.array(np.broadcast_to(item, self.shape))
+            return
+        for name in self._formats:
+            self[name][key] = item[name]
+
+    def add_column(self, name, column):
+        """Add the variable name using column (not copied if contiguous)"""
+        column = np.ascontiguousarray(column)
+        if column.shape != self.shape:
+            raise ValueError('{} has the shape {} instead of '
+                             '{}'.format(name, column.shape, self.shape))
+        self._formats[name] = column.dtype
+        self._columns[name] = column
+
+    def __delitem__(self, key):
+        if key not in self._formats:
+            raise KeyError(key)
+        del self._formats[key]
+        self._columns.pop(key, None)
+        self._buffers.pop(key, None)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def _load(self, name):
+        """Return a variable which is not in memory"""
+        raise KeyError(name)
+
+    def _column(self, name):
+        """Return a variable without keeping it in memory if not loaded"""
+        if name in self._columns:
+            return self._columns[name]
+        return self._load(name)
+
+    @property
+    def dtype(self):
+        """Return the equivalent structured dtype"""
+        return np.dtype([(str(name), fmt)
+                         for name, fmt in self._formats.items()])
+
+    @property
+    def ndim(self):
+        """Return the number of dimensions"""
+        return len(self.shape)
+
+    @property
+    def size(self):
+        """Return the number of points"""
+        return int(np.prod(self.shape))
+
+    @property
+    def T(self):
+        """Return the transposed trajectories"""
+        return ColumnarArray([(name, self[name].T) for name in self._formats],
+                             shape=self.shape[::-1])
+
+    def copy(self):
+        """Return a copy of the trajectories"""
+        return ColumnarArray([(name, self[name].copy())
+                              for name in self._formats], shape=self.shape)
+
+    def to_array(self):
+        """Return all the variables as a structured array"""
+        array = np.zeros(self.shape, dtype=self.dtype)
+        for name in self._formats:
+            array[name] = self._column(name)
+        return array
+
+    def append(self, arrays, axis=0, growth=1.5):
+        """ Append structured or columnar arrays along axis
+
+        Each variable keeps spare capacity (see append_to_buffer) so that
+        repeated appends are linear in the total size.
+        """
+        for array in arrays:
+            if array.dtype.names != self.dtype.names:
+                raise ValueError('all the trajectories must contain the '
+                                 'variables {}'.format(self.dtype.names))
+        shape = list(self.shape)
+        shape[axis] += sum(array.shape[axis] for array in arrays)
+        for name in self._formats:
+            self._columns[name], self._buffers[name] = append_to_buffer(
+                self[name], self._buffers.get(name),
+                [array[name] for array in arrays], axis=axis, growth=growth)
+        self.shape = tuple(shape)
+
+    def trim(self):
+        """Release the spare capacity left by append"""
+        for name, column in self._columns.items():
+            if is_buffer_view(column, self._buffers.get(name)):
+                self._columns[name] = column.copy()
+        self._buffers = {}
+
+
+def is_buffer_view(array, buffer):
+    """True if array is the buffer[:n, :m] view of buffer"""
+    if buffer is None or not isinstance(array, np.ndarray):
+        return False
+    return array.base is buffer and \
+        array.__array_interface__['data'][0] == \
+        buffer.__array_interface__['data'][0] and \
+        array.strides == buffer.strides
+
+
+def append_to_buffer(current, buffer, arrays, axis=0, growth=1.5):
+    """ Append arrays to current along axis using spare capacity
+
+    Parameters
+    ----------
+    current: ndarray (ntra, ntime)
+        the array to append to; if it is the buffer[:ntra, :ntime] view of
+        buffer and buffer is large enough no copy of current is made
+    buffer: ndarray or None
+        the buffer returned by the previous call
+    arrays: list of ndarray
+        arrays to append
+    axis: int, default 0
+        0 to append trajectories, 1 to append timesteps
+    growth: float, default 1.5
+        factor by which the capacity grows when the buffer is full
+
+    Returns
+    -------
+    view, buffer
+        the appended array as a view of the buffer and the buffer
+    """
+    other = 1 - axis
+    shape = list(current.shape)
+    shape[axis] += sum(array.shape[axis] for array in arrays)
+    for array in arrays:
+        if array.shape[other] != shape[other]:
+            raise ValueError('all the trajectories must have {} '
+                             '{}'.format(shape[other],
+                                         ('trajectories', 'timesteps')
+                                         [other]))
+
+    if not is_buffer_view(current, buffer) or \
+            buffer.shape[axis] < shape[axis] or \
+            buffer.shape[other] < shape[other]:
+        capacity = list(shape)
+        if is_buffer_view(current, buffer):
+            capacity[axis] = max(shape[axis],
+                                 int(buffer.shape[axis] * growth))
+        buffer = np.empty(capacity, dtype=current.dtype)
+        buffer[:current.shape[0], :current.shape[1]] = current
+
+    start = current.shape[axis]
+    for array in arrays:
+        stop = start + array.shape[axis]
+        if axis == 0:
+            buffer[start:stop, :shape[1]] = array
+        else:
+            buffer[:shape[0], start:stop] = array
+        start = stop
+    return buffer[:shape[0], :shape[1]], buffer
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time axis of the trajectories
+
+Conversions between the times found in LAGRANTO files (hours, seconds or
+hh.mm since the start date) and datetime64[s] arrays; only array arithmetic
+is used, so the cost is negligible compared to reading the data.
+"""
+import numpy as np
+
+UNITS = ('hours', 'seconds', 'hhmm')
+
+
+def _check_unit(unit):
+    if unit not in UNITS:
+        raise ValueError('unit must be one of ({})'.format(', '.join(UNITS)))
+
+
+def to_datetime64(date):
+    """Return date (datetime, string or datetime64) as a datetime64[s]"""
+    return np.datetime64(date, 's')
+
+
+def hhmm_to_frac(times):
+    """Change from hh.mm to fractional hours"""
+    times = np.asarray(times, dtype='f8')
+    hours = np.trunc(times)
+    return hours + np.around((times - hours) * 100) / 60
+
+
+def frac_to_hhmm(hours):
+    """Change from fractional hours to hh.mm"""
+    hours = np.asarray(hours, dtype='f8')
+    full = np.trunc(hours)
+    return full + 0.6 * (hours - full)
+
+
+def times_to_seconds(times, unit='hours'):
+    """ Convert times since the start date into integer seconds
+
+        Parameters
+        ----------
+        times: array_like
+            times in hours, seconds or hh.mm
+        unit: string, default hours
+            unit of times; hours, seconds or hhmm
+
+        Returns
+        -------
+        ndarray of int64, rounded to the nearest second
+    """
+    _check_unit(unit)
+    times = np.asarray(times, dtype='f8')
+    if unit == 'hhmm':
+        hours = np.trunc(times)
+        minutes = hours * 60 + np.around((times - hours) * 100)
+        return minutes.astype('i8') * 60
+    if unit == 'hours':
+        times = times * 3600
+    return np.around(times).astype('i8')
+
+
+def seconds_to_times(seconds, unit='hours'):
+    """Convert seconds since the start date into hours, seconds or hh.mm"""
+    _check_unit(unit)
+    seconds = np.asarray(seconds)
+    if unit == 'seconds':
+        return seconds.astype('f8')
+    hours = seconds / 3600.
+    if unit == 'hhmm':
+        return frac_to_hhmm(hours)
+    return hours
+
+
+def times_to_datetime64(times, startdate, unit='hours'):
+    """Return startdate + times as an array of datetime64[s]"""
+    seconds = times_to_seconds(times, unit=unit)
+    return to_datetime64(startdate) + seconds.astype('timedelta64[s]')
+
+
+def datetime64_to_times(dates, startdate, unit='hours'):
+    """Return dates - startdate in hours, seconds or hh.mm"""
+    dates = np.asarray(dates).astype('datetime64[s]')
+    seconds = (dates - to_datetime64(startdate)).astype('i8')
+    return seconds_to_times(seconds, unit=unit)
@@ -8,14 +8,21 @@ Created on Wed Jan 19 11:28:58 2022
 
 # coding: utf8
 import gzip
+import json
+import struct
 from datetime import datetime, timedelta
 from functools import partial
 
 import netCDF4
 import numpy as np
 
+from .traj_storage import ColumnarArray
+from .traj_time import (hhmm_to_frac, times_to_datetime64,
+                        datetime64_to_times)
+
 def from_netcdf(filename, usedatetime=True, msv=-999, unit='hours',
-                exclude=None, date=None, indices=None):
+                exclude=None, date=None, indices=None, lazy=False,
+                start=None, end=None, step=None):
     """ Load trajectories from a netcdf
 
 
@@ -35,66 +42,161 @@ def from_netcdf(filename, usedatetime=True, msv=-999, unit='hours',
         date: datetime or list
                 Can be used to select particular dates, for example
                 to read in a single timestep
-        indices: list or tuple
-                Can be used to select particular trajectories
+        indices: list, tuple or array of int or bool
+                Can be used to select particular trajectories, by index
+                or with a boolean mask
+        lazy: bool, default False
+                If True return a LazyNetcdf instead of a structured array;
+                the file is kept open and each variable is read
+                the first time it is accessed
+        start, end: datetime (or time if usedatetime is False), optional
+                Select the time steps between start and end (included)
+        step: int or timedelta, optional
+                Keep one time step every step (e.g. timedelta(hours=6))
+
+        Only the selected time steps and trajectories are read from the
+        file: regularly spaced selections are read as (strided) slices.
+
+        Examples
+        --------
+
+        >>> array, startdate = from_netcdf(filename,
+        ...                                start=datetime(2000, 10, 14, 6),
+        ...                                step=timedelta(hours=6))
     """
-    if exclude is None:
-        exclude = []
-    exclude.append('BASEDATE')
     try:
-        with netCDF4.Dataset(filename) as ncfile:
+        ncfile = netCDF4.Dataset(filename)
+        try:
+            array = LazyNetcdf(ncfile, usedatetime=usedatetime, msv=msv,
+                               unit=unit, exclude=exclude, date=date,
+                               indices=indices, start=start, end=end,
+                               step=step)
+            starttime = array.startdate
+            if not lazy:
+                array = array.to_array()
+                ncfile.close()
+        except Exception:
+            ncfile.close()
+            raise
+    except RuntimeError as err:
+        err.args += (str(filename), )
+        raise
+    return array, starttime
 
-            variables = [var for var in ncfile.variables if var not in exclude]
 
-            formats = [ncfile.variables[var].dtype for var in variables]
+class LazyNetcdf(ColumnarArray):
+    """ Trajectories of a netcdf file read on demand
 
-            if usedatetime:
-                formats[variables.index('time')] = 'datetime64[s]'
+    Behave like the structured array returned by from_netcdf
+    (dtype, shape, ndim and access by variable name) but a variable is only
+    read, with the `date`/`indices` subsetting applied, the first time it is
+    accessed. Read variables are cached until `release` is called.
 
-            ntra, ntime = _get_netcdf_traj_dim(ncfile)
+    Parameters
+    ----------
+    ncfile : netCDF4.Dataset
+        open dataset; it is not closed until `close` is called
+    usedatetime, msv, unit, exclude, date, indices, start, end, step:
+        see from_netcdf
+
+    Examples
+    --------
+
+    >>> array, startdate = from_netcdf(filename, lazy=True)
+    >>> array.shape  # nothing read yet
+    >>> array['p']  # read p only
+    >>> array.release()
+    """
 
-            dates = _netcdf_time(ncfile, usedatetime=usedatetime, unit=unit)
+    def __init__(self, ncfile, usedatetime=True, msv=-999, unit='hours',
+                 exclude=None, date=None, indices=None, start=None, end=None,
+                 step=None):
+        exclude = ['BASEDATE'] + list(exclude if exclude else [])
+        self.ncfile = ncfile
+        self.msv = msv
 
-            dates, index = _return_subset_netcdf(dates, date=date, indices=indices)
+        ncnames = [var for var in ncfile.variables if var not in exclude]
+        rename = {'latitude': u'lat', 'longitude': u'lon'}
+        names = [rename.get(var, var) for var in ncnames]
+        self._ncnames = dict(zip(names, ncnames))
 
-            ntime = ntime if date is None else len(dates)
-            ntra = ntra if indices is None else len(index[1])
+        ntra, ntime = _get_netcdf_traj_dim(ncfile)
 
-            array = np.zeros((ntra, ntime), dtype={'names': variables,
-                                                   'formats': formats})
+        dates = _netcdf_time(ncfile, usedatetime=usedatetime, unit=unit)
 
-            array['time'] = repeat_time(dates, ntra)
+        self._dates, self._index = _return_subset_netcdf(
+            dates, date=date, indices=indices, start=start, end=end,
+            step=step)
 
-            for var in variables:
-                if var == 'time':
-                    continue
-                vardata = ncfile.variables[var][index].T
-                vardata[vardata <= msv] = np.nan
+        ntime = len(self._dates)
+        ntra = _index_length(self._index[1], ntra)
+        ColumnarArray.__init__(self, shape=(ntra, ntime))
 
-                # Check need for netcdf trajectories produced by LAGRANTO
-                # which make use of a old fortran library to write netcdf.
-                # This library add two dummies dimensions.
-                if vardata.ndim > 2:
-                    array[var] = vardata.squeeze()
-                else:
-                    array[var] = vardata
-
-            if 'latitude' in variables:
-                variables[variables.index('latitude')] = u'lat'
-                variables[variables.index('longitude')] = u'lon'
-                try:
-                    array.dtype.names = variables
-                except ValueError:
-                    array.dtype.names = [v.encode('utf8') for v in variables]
-
-            starttime = get_netcdf_startdate(ncfile)
-            time_zero = ncfile.variables['time'][0]
-            if time_zero != 0:
-                starttime += timedelta(**{unit: int(time_zero)})
-    except RuntimeError as err:
-        err.args += (str(filename), )
-        raise
-    return array, starttime
+        for name, ncname in self._ncnames.items():
+            self._formats[name] = ncfile.variables[ncname].dtype
+        if usedatetime:
+            self._formats['time'] = np.dtype('datetime64[s]')
+
+        self.startdate = get_netcdf_startdate(ncfile)
+        time_zero = ncfile.variables['time'][0]
+        if time_zero != 0:
+            self.startdate += timedelta(**{unit: int(time_zero)})
+
+    @property
+    def loaded(self):
+        """Return the names of the variables currently in memory"""
+        return list(self._columns)
+
+    def _load(self, var):
+        if var == 'time':
+            return self._dates.reshape(1, -1).repeat(self.shape[0], axis=0)
+        ncvar = self.ncfile.variables[self._ncnames[var]]
+        return _read_netcdf_variable(ncvar, self._index, self.shape,
+                                     self._formats[var], msv=self.msv)
+
+    def release(self, variables=None):
+        """ Remove variables from memory
+
+        They are read again from the file at the next access.
+        Variables which are not in the file (added after loading) are kept.
+
+        Parameters
+        ----------
+        variables: string or list of string, default all variables
+        """
+        if variables is None:
+            variables = list(self._columns)
+        elif isinstance(variables, str):
+            variables = [variables]
+        for var in variables:
+            if var in self._ncnames:
+                self._columns.pop(var, None)
+
+    def close(self):
+        """Close the netcdf file"""
+        self.ncfile.close()
+
+
+def _read_netcdf_variable(ncvar, index, shape, dtype, msv=-999):
+    """ Read a (ntra, ntime) variable with the missing values as nan
+
+    Netcdf trajectories produced by LAGRANTO make use of an old fortran
+    library which add two dummies dimensions; the trajectories are then
+    along the last dimension.
+    """
+    read, select = zip(*[_hyperslab(idx) for idx in index])
+    if ncvar.ndim > 2:
+        read = [read[0]] + [slice(None)] * (ncvar.ndim - 2) + [read[1]]
+    vardata = ncvar[tuple(read)]
+    # the irregular selections are done in memory
+    for axis, idx in ((0, select[0]), (-1, select[1])):
+        if not isinstance(idx, slice):
+            vardata = np.take(vardata, idx, axis=axis)
+    vardata = vardata.T
+    vardata[vardata <= msv] = np.nan
+    array = np.empty(shape, dtype=dtype)
+    array[...] = np.ma.getdata(vardata).reshape(shape)
+    return array
 
 
 def get_netcdf_startdate(ncfile):
@@ -123,60 +225,142 @@ def _netcdf_time(ncfile, usedatetime=True, unit='hours'):
             unit of times hours or seconds
     """
     if usedatetime:
-        otimes = ncfile.variables['time'][:]
+        # lagranto may write the times as hh.mm instead as fractional times
+        times = np.ma.getdata(ncfile.variables['time'][:])
         starttime = get_netcdf_startdate(ncfile)
-
-        if unit == 'hhmm':
-            # lagranto writes the times as hh.mm instead as fractional times
-            times = hhmm2frac(otimes)
-            unit = 'hours'
-        else:
-            times = otimes
-
-        units = '{} since {:%Y-%m-%d %H:%M:%S}'.format(unit, starttime)
-
-        dates = netCDF4.num2date(times, units=units)
-        return dates
+        return times_to_datetime64(times, starttime, unit=unit)
 
     return ncfile['time'][:]
 
 
-def _return_subset_netcdf(dates, date=None, indices=None):
+def _return_subset_netcdf(dates, date=None, indices=None, start=None,
+                          end=None, step=None):
     """
 
     Parameters
     ----------
-    dates: list of dates
+    dates: array of datetime64 or times
         trajectories times
     date: single date or list of dates
         Allow to select timestep of the trajectories
-    indices: single index or list of indices
+    indices: list, tuple or array of int or bool
         Allow to select subset of trajectories
+    start, end, step:
+        Allow to select a range of timesteps (see from_netcdf)
 
     Returns
     -------
     dates: list of dates
-        Filtered using `date`
-    indices: list of slices
+        Filtered using `date` or `start`, `end`, `step`
+    indices: list of slices or arrays
         if no selection is done index is [slice(None), slice(None)]
     """
+    dates = np.ma.getdata(dates)
     index = [slice(None), slice(None)]
     if date is not None:
+        if start is not None or end is not None or step is not None:
+            raise ValueError('date cannot be combined with start, end '
+                             'or step')
         if not isinstance(date, (list, tuple)):
             date = [date]
-        d_index = np.hstack([np.where(dates == d)[0] for d in date])
+        d_index = _find_times(dates, date)
         if d_index.size == 0:
             sdate = [str(d) for d in date]
             msg = '{} not found in time'.format(','.join(sdate))
             raise RuntimeError(msg)
-        index = [np.sort(d_index), slice(None)]
-        dates = dates[d_index]
+        index[0] = np.unique(d_index)
+    elif start is not None or end is not None or step is not None:
+        first, last = _time_range(dates, start, end)
+        index[0] = slice(first, last, _time_stride(dates, step))
 
     if indices is not None:
-        if not isinstance(indices, (list, tuple)):
-            raise ValueError('indices must be of type list or tuple')
+        if not isinstance(indices, (list, tuple, np.ndarray)):
+            raise ValueError('indices must be of type list, tuple or array')
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
         index[1] = indices
-    return dates, index
+    return dates[index[0]], index
+
+
+def _find_times(dates, values):
+    """Return the positions of values in dates (missing values are skipped)"""
+    values = np.asarray(values).astype(dates.dtype)
+    order = np.argsort(dates, kind='stable')
+    pos = np.clip(np.searchsorted(dates[order], values), 0, len(dates) - 1)
+    found = dates[order][pos] == values
+    return order[pos[found]]
+
+
+def _time_range(dates, start=None, end=None):
+    """ Return first, last such that dates[first:last] are between start and
+    end (included); dates are sorted in ascending or descending order
+    (backward trajectories)
+    """
+    descending = len(dates) > 1 and dates[-1] < dates[0]
+    times = dates[::-1] if descending else dates
+    first, last = 0, len(times)
+    if start is not None:
+        first = np.searchsorted(times, np.asarray(start).astype(times.dtype),
+                                side='left')
+    if end is not None:
+        last = np.searchsorted(times, np.asarray(end).astype(times.dtype),
+                               side='right')
+    if descending:
+        first, last = len(times) - last, len(times) - first
+    return int(first), int(max(first, last))
+
+
+def _time_stride(dates, step=None):
+    """Return step (int or timedelta) as a number of time steps"""
+    if step is None:
+        return None
+    if isinstance(step, (int, np.integer)):
+        stride = step
+    else:
+        if len(dates) < 2:
+            return None
+        interval = np.abs(dates[1] - dates[0])
+        if np.issubdtype(dates.dtype, np.datetime64):
+            step = np.timedelta64(step).astype(interval.dtype)
+        ratio = step / interval
+        stride = int(np.around(ratio))
+        if not np.isclose(ratio, stride):
+            raise ValueError('step must be a multiple of the time step '
+                             '{}'.format(interval))
+    if stride < 1:
+        raise ValueError('step must be positive')
+    return stride
+
+
+def _hyperslab(index):
+    """ Return (read, select) to read index from a netcdf variable
+
+    Regularly spaced indices are read as a (strided) slice; other sorted
+    indices are read with the slice covering them if they are dense enough
+    and then selected in memory with select.
+    """
+    if isinstance(index, slice):
+        return index, slice(None)
+    index = np.asarray(index)
+    if index.size == 0:
+        return index, slice(None)
+    if index.size == 1:
+        return slice(int(index[0]), int(index[0]) + 1), slice(None)
+    step = np.diff(index)
+    if step[0] > 0 and (step == step[0]).all():
+        return slice(int(index[0]), int(index[-1]) + 1,
+                     int(step[0])), slice(None)
+    if (step > 0).all() and index[-1] - index[0] < 4 * index.size:
+        return slice(int(index[0]), int(index[-1]) + 1), index - index[0]
+    return index, slice(None)
+
+
+def _index_length(index, size):
+    """Return the number of elements of size selected by index"""
+    if isinstance(index, slice):
+        return len(range(size)[index])
+    return len(index)
 
 
 def repeat_time(dates, ntra):
@@ -214,10 +398,9 @@ def datetime_to_hours_since_start(date, start, units='hhmm'):
     return hours
 
 
-def vectorized_datetime_to_hours(*args, **kwargs):
+def vectorized_datetime_to_hours(dates, start, units='hhmm'):
     """Return a vectorized version of datetime_to_hours_since_start"""
-    vectorized = np.vectorize(datetime_to_hours_since_start)
-    return vectorized(*args, **kwargs)
+    return datetime64_to_times(dates, start, unit=units)
 
 
 def hhmm_to_hours(time):
@@ -232,10 +415,9 @@ def hhmm_to_hours(time):
     return time
 
 
-def hhmm2frac(*args, **kwargs):
+def hhmm2frac(times):
     """Return a vectorized version of hhmm_to_hours"""
-    vectorized = np.vectorize(hhmm_to_hours)
-    return vectorized(*args, **kwargs)
+    return hhmm_to_frac(times)
 
 
 def time_since_start_to_datetime(start, time, unit='hhmm'):
@@ -255,18 +437,8 @@ def add_times_to_netcdf(ncfile, times, startdate, unit='hours'):
     ncfile.ref_year, ncfile.ref_month, ncfile.ref_day, ncfile.ref_hour,\
         ncfile.ref_min = startdate.timetuple()[0:5]
     ntimes = ncfile.createVariable('time', 'f4', ('ntim', ))
-    units = ''
-    if unit == 'seconds':
-        units = 'seconds since {:%Y-%m-%d %H:%M:%S}'.format(startdate)
-    elif unit == 'hours':
-        units = 'hours since {:%Y-%m-%d %H:%M:%S}'.format(startdate)
-    elif unit == 'hhmm':
-        hhmms = vectorized_datetime_to_hours(times.astype(datetime), startdate)
-        ntimes[:] = hhmms[0, :]
-        return
-
     if isinstance(times[0, 0], np.datetime64):
-        ntimes[:] = netCDF4.date2num(times[0, :].astype(datetime), units)
+        ntimes[:] = datetime64_to_times(times[0, :], startdate, unit=unit)
     else:
         ntimes[:] = times[0, :] + shift / 3600
 
@@ -308,17 +480,12 @@ def to_netcdf(trajs, filename, exclude=None, unit='hours'):
             vararray[:] = trajs[var].T
 
 
-def to_ascii(trajs, filename, mode='w', gz=False, digit=3):
+def to_ascii(trajs, filename, mode='w', gz=False, digit=3, blocksize=1000):
     """ Write the trajectories in an ASCII format
 
-        Parameters:
-
-        filename : string
-            filename where the trajectories are written
-        mode : string, default w
-            define the mode for opening the file.
-            By default in write mode ('w'),
-            append (a) is another option
+    The trajectories are formatted and written by blocks of `blocksize`
+    trajectories, so the memory needed does not depend on the number
+    of trajectories; trajs is not modified.
 
     Parameters
     ----------
@@ -333,87 +500,71 @@ def to_ascii(trajs, filename, mode='w', gz=False, digit=3):
     digit: int, default 3
         Number of digit after the comma to use for lon, lat;
         Only 3 or 2 digits allowed
+    blocksize: int, default 1000
+        Number of trajectories formatted at once
 
     """
-    if trajs['time'].dtype != np.float:
-        trajs['timeh'] = vectorized_datetime_to_hours(
-            trajs['time'].astype(datetime), trajs.initial)
-
-    for var in trajs.variables[1:]:
-        trajs[var][np.isnan(trajs[var])] = -1000
-
-    # skip 'time' and move 'timeh' to front
-    if trajs['time'].dtype != np.float:
-        variables = ['timeh']+trajs.variables[1:-1]
-    else:
-        variables = trajs.variables
-
-    ntraj = trajs.shape[0]
-    ntim = trajs.shape[1]
-    nvar = len(variables)
-
-    trajs_resh = np.reshape(np.array([np.reshape(trajs[var], ntraj*ntim)
-                                      for var in variables]).T,
-                            ntraj*ntim*nvar)
     # String template for header, variables header and variables
     header = 'Reference date {:%Y%m%d_%H%M} / Time range{:>8.0f} min\n \n'
     varheader = '{:>7}{:>10}{:>9}{:>6}'
+    lineheader = '{:->7}{:->10}{:->9}{:->6}'
 
     if digit == 2:
-        fixvar = '{:>7.2f}{:>9.2f}{:>8.2f}{:>6.0f}'
-        lineheader = '{:->7}{:->10}{:->9}{:->6}'
+        fixvar = '%7.2f%9.2f%8.2f%6.0f'
     elif digit == 3:
-        fixvar = '{:>7.2f}{:>10.3f}{:>9.3f}{:>6.0f}'
-        lineheader = '{:->7}{:->10}{:->9}{:->6}'
+        fixvar = '%7.2f%10.3f%9.3f%6.0f'
     else:
         raise ValueError('digit must be either 2 or 3')
-    row_format = (' \n' + ((fixvar + '{:>10.3f}' * (nvar - 4)+'\n') * ntim))
-    row_format *= ntraj
+
+    variables = trajs.variables
+    nvar = len(variables)
+    traj_format = ' \n' + (fixvar + '%10.3f' * (nvar - 4) + '\n') * trajs.ntime
 
     if gz:
-        with gzip.open(filename, mode + 't') as fname:
-            # write the header
-            fname.write(header.format(trajs.startdate, trajs.duration))
-
-            # write the variables header
-            if trajs['time'].dtype != np.float:
-                fname.write((varheader + '{:>10}' * (nvar - 4)
-                            ).format(*trajs.variables[:-1]) + '\n')
-            else:
-                fname.write((varheader + '{:>10}' * (nvar - 4)
-                            ).format(*trajs.variables) + '\n')
-
-            # write the line
-            fname.write(
-                (lineheader + '{:->10}' * (nvar - 4)
-                ).format(*[''] * nvar) + '\n')
-
-            # write the variables values
-            fname.write(row_format.format(*trajs_resh))
+        fname = gzip.open(filename, mode + 't')
     else:
-        with open(filename, mode) as fname:
-            # write the header
-            fname.write(header.format(trajs.startdate, trajs.duration))
+        fname = open(filename, mode)
+    with fname:
+        # write the header
+        fname.write(header.format(trajs.startdate, trajs.duration))
 
-            # write the variables header
-            if trajs['time'].dtype != np.float:
-                fname.write((varheader + '{:>10}' * (nvar - 4)
-                            ).format(*trajs.variables[:-1]) + '\n')
-            else:
-                fname.write((varheader + '{:>10}' * (nvar - 4)
-                            ).format(*trajs.variables) + '\n')
+        # write the variables header
+        fname.write((varheader + '{:>10}' * (nvar - 4)
+                     ).format(*variables) + '\n')
 
-            # write the line
-            fname.write(
-                (lineheader + '{:->10}' * (nvar - 4)
-                ).format(*[''] * nvar) + '\n')
+        # write the line
+        fname.write((lineheader + '{:->10}' * (nvar - 4)
+                     ).format(*[''] * nvar) + '\n')
 
-            # write the variables values
-            fname.write(row_format.format(*trajs_resh))
+        # write the variables values
+        block_format = traj_format * blocksize
+        for block in _iter_ascii_blocks(trajs, blocksize):
+            if len(block) != blocksize:
+                block_format = traj_format * len(block)
+            fname.write(block_format % tuple(block.ravel().tolist()))
 
-    # remove the artificial timeh
-    if trajs['time'].dtype != np.float:
-        trajs.set_array(trajs[[name for name in trajs.variables[:-1]]])
+
+def _iter_ascii_blocks(trajs, blocksize):
+    """ Yield blocks of trajectories as (ntra, ntime, nvar) float arrays
+
+        Times are converted to hh.mm and missing values set to -1000
+    """
+    columns = [trajs[var] for var in trajs.variables]
+    for start in range(0, trajs.ntra, blocksize):
+        stop = start + blocksize
+        nblock = len(columns[0][start:stop])
+        block = np.empty((nblock, trajs.ntime, len(columns)), dtype='f8')
+        for ivar, (var, column) in enumerate(zip(trajs.variables, columns)):
+            if var == 'time':
+                if np.issubdtype(column.dtype, np.datetime64):
+                    block[..., ivar] = datetime64_to_times(
+                        column[start:stop], trajs.initial, unit='hhmm')
+                else:
+                    block[..., ivar] = column[start:stop]
+                continue
+            block[..., ivar] = column[start:stop]
+            block[..., ivar][np.isnan(block[..., ivar])] = -1000
+        yield block
 
 
 def header_to_date(header):
@@ -439,8 +590,9 @@ def get_ascii_timestep_period(times, usedatetime=True):
         timestep = times[1] - times[0]
         period = times[-1] - times[0]
     else:
-        timestep = hhmm_to_hours(times[1]) - hhmm_to_hours(times[0])
-        period = hhmm_to_hours(times[-1]) - hhmm_to_hours(times[0])
+        hours = hhmm_to_frac(times[[0, 1, -1]])
+        timestep = hours[1] - hours[0]
+        period = hours[2] - hours[0]
     return timestep, period
 
 
@@ -459,7 +611,8 @@ def get_ascii_header_variables(filename, gz=False):
     return header, variables
 
 
-def from_ascii(filename, usedatetime=True, msv=-999.999, gz=False):
+def from_ascii(filename, usedatetime=True, msv=-999.999, gz=False,
+               engine='numpy'):
     """ Load trajectories from an ascii file
 
         Parameters:
@@ -470,7 +623,153 @@ def from_ascii(filename, usedatetime=True, msv=-999.999, gz=False):
                Change <msv> value into np.nan
         gzip: bool, default False
               If true read from gzip file
+        engine: string, default numpy
+              Parser to use; numpy splits the fixed-width columns
+              of the whole file at once, genfromtxt is the former
+              line by line parser
     """
+    if engine == 'genfromtxt':
+        return _from_ascii_genfromtxt(filename, usedatetime=usedatetime,
+                                      msv=msv, gz=gz)
+    if engine != 'numpy':
+        raise ValueError('engine must be either numpy or genfromtxt')
+
+    header, variables = get_ascii_header_variables(filename, gz=gz)
+
+    startdate = header_to_date(header)
+
+    chars = _ascii_body_to_chars(read_ascii_buffer(filename, gz=gz))
+    columns = _fixed_width_columns(chars)
+    if len(columns) != len(variables):
+        raise IOError('Found {} columns for {} variables in {}'.format(
+            len(columns), len(variables), filename))
+
+    dtypes = ['f8']*(len(variables))
+    if usedatetime:
+        dtypes[variables.index('time')] = 'datetime64[s]'
+
+    array = np.empty(chars.shape[0], dtype={'names': variables,
+                                            'formats': dtypes})
+    for var, (start, end) in zip(variables, columns):
+        values = _parse_fixed_width(chars[:, start:end])
+        if (var == 'time') and usedatetime:
+            array[var] = times_to_datetime64(values, startdate, unit='hhmm')
+            continue
+        values[values == msv] = np.nan
+        array[var] = values
+    timestep, period = get_ascii_timestep_period(array['time'], usedatetime)
+
+    # period/timestep gives strange offset (related to precision??)
+    # so use scipy.around
+    ntime = int(1 + np.around(period / timestep))
+    ntra = int(array.size / ntime)
+
+    array = array.reshape((ntra, ntime))
+    return array, startdate
+
+
+def read_ascii_buffer(filename, gz=False):
+    """return the content of an ascii file as bytes"""
+    if gz:
+        with gzip.open(filename, 'rb') as fname:
+            return fname.read()
+    with open(filename, 'rb') as fname:
+        return fname.read()
+
+
+def _ascii_body_to_chars(buffer, skip_header=5):
+    """ return the data lines of an ascii file as a 2D array of characters
+
+        Blank lines (separating the trajectories) are dropped and
+        shorter lines are padded with spaces
+    """
+    chars = np.frombuffer(buffer, dtype=np.uint8)
+    newlines = np.flatnonzero(chars == ord('\n'))
+    if newlines.size < skip_header:
+        return np.zeros((0, 0), dtype=np.uint8)
+    chars = chars[newlines[skip_header - 1] + 1:].copy()
+    # carriage returns and tabs are handled as spaces
+    chars[(chars == ord('\r')) | (chars == ord('\t'))] = ord(' ')
+
+    isnewline = chars == ord('\n')
+    ends = np.flatnonzero(isnewline)
+    if ends.size == 0 or ends[-1] != chars.size - 1:
+        ends = np.append(ends, chars.size)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    # a line is kept if it contains any non blank character
+    nonblank = (chars != ord(' ')) & ~isnewline
+    keep = np.logical_or.reduceat(nonblank, starts)
+    lengths = (ends - starts)[keep]
+    width = lengths.max() if lengths.size else 0
+
+    if (lengths == width).all():
+        # usual case, all lines have the same length
+        inline = np.repeat(keep, np.diff(np.append(starts, chars.size)))
+        inline &= ~isnewline
+        return chars[inline].reshape(lengths.size, width)
+
+    starts = starts[keep]
+    offsets = np.arange(width)
+    index = starts[:, None] + offsets[None, :]
+    inline = offsets[None, :] < lengths[:, None]
+    lines = np.full(index.shape, ord(' '), dtype=np.uint8)
+    lines[inline] = chars[index[inline]]
+    return lines
+
+
+def _fixed_width_columns(lines):
+    """ return the (start, end) of each right-aligned column
+
+        The last character of a right-aligned field is never blank;
+        a column ends where a character present on all lines is
+        followed by a blank on at least one line.
+    """
+    filled = (lines != ord(' ')).all(axis=0)
+    ends = np.flatnonzero(filled & ~np.append(filled[1:], False)) + 1
+    starts = np.concatenate(([0], ends[:-1]))
+    return list(zip(starts, ends))
+
+
+def _parse_fixed_width(field):
+    """ Convert a 2D array of characters into floats
+
+        Handle plain decimal numbers (sign, digits and one decimal point)
+        with array arithmetic; fall back to numpy string conversion for
+        anything else (exponent, nan, ...)
+    """
+    # Horner scheme over the character positions of the field
+    columns = np.ascontiguousarray(field.T)
+    mantissa = np.zeros(columns.shape[1], dtype='i8')
+    decimals = np.zeros(columns.shape[1], dtype='i8')
+    dots = np.zeros(columns.shape[1], dtype='i1')
+    negative = np.zeros(columns.shape[1], dtype=bool)
+    unknown = False
+    for char in columns:
+        digit = char - np.uint8(ord('0'))
+        isdigit = digit <= 9
+        mantissa = np.where(isdigit, mantissa * 10 + digit, mantissa)
+        decimals += isdigit & (dots > 0)
+        isdot = char == ord('.')
+        dots += isdot
+        isminus = char == ord('-')
+        negative |= isminus
+        unknown = unknown or not (isdigit | isdot | isminus |
+                                  (char == ord(' ')) |
+                                  (char == ord('+'))).all()
+    if unknown or (dots > 1).any():
+        width = field.shape[1]
+        strings = np.ascontiguousarray(field).view('S{}'.format(width))
+        return strings.ravel().astype('f8')
+
+    values = mantissa / 10. ** decimals
+    values[negative] *= -1
+    return values
+
+
+def _from_ascii_genfromtxt(filename, usedatetime=True, msv=-999.999,
+                           gz=False):
+    """Load trajectories from an ascii file using np.genfromtxt"""
     header, variables = get_ascii_header_variables(filename, gz=gz)
 
     startdate = header_to_date(header)
@@ -499,3 +798,169 @@ def from_ascii(filename, usedatetime=True, msv=-999.999, gz=False):
     array = array.reshape((ntra, ntime))
     return array, startdate
 
+
+NATIVE_MAGIC = b'TRAJVIEW'
+NATIVE_VERSION = 1
+NATIVE_ALIGNMENT = 4096
+
+
+def to_native(trajs, filename):
+    """ Write the trajectories in the native binary format
+
+    The file contains a header (start date, shape and variables) followed by
+    the raw little-endian (ntra, ntime) array of each variable, aligned on
+    4096 bytes, so that from_native can memory map it.
+
+    Layout::
+
+        b'TRAJVIEW' | header length (uint32 little-endian) | json header
+        | padding | variable 1 | padding | variable 2 | ...
+
+    Parameters
+    ----------
+    trajs : Tra
+        A Tra instance
+    filename : string
+        The name of the output file
+    """
+    dtypes = [np.dtype(trajs[var].dtype).newbyteorder('<')
+              for var in trajs.variables]
+    nbytes = [dtype.itemsize * trajs.ntra * trajs.ntime for dtype in dtypes]
+
+    # the header contains the offsets of the variables, which depend on
+    # the length of the header: start with one block and grow if needed
+    start = NATIVE_ALIGNMENT
+    while True:
+        header = {'version': NATIVE_VERSION,
+                  'startdate': trajs.startdate.isoformat(),
+                  'shape': [trajs.ntra, trajs.ntime],
+                  'variables': []}
+        offset = start
+        for var, dtype, size in zip(trajs.variables, dtypes, nbytes):
+            header['variables'].append({'name': var, 'dtype': dtype.str,
+                                        'offset': offset})
+            offset = _align(offset + size)
+        header = json.dumps(header).encode('utf8')
+        if len(NATIVE_MAGIC) + 4 + len(header) <= start:
+            break
+        start = _align(len(NATIVE_MAGIC) + 4 + len(header))
+
+    with open(filename, 'wb') as fname:
+        fname.write(NATIVE_MAGIC)
+        fname.write(struct.pack('<I', len(header)))
+        fname.write(header)
+        for var, dtype, size in zip(trajs.variables, dtypes, nbytes):
+            fname.write(b'\0' * (_align(fname.tell()) - fname.tell()))
+            data = np.ascontiguousarray(trajs[var], dtype=dtype)
+            fname.write(data.view(np.uint8).data)
+
+
+def from_native(filename, mode='c'):
+    """ Load trajectories from a file in the native binary format
+
+    The file is memory mapped: nothing is read before a variable is used
+    and only the touched pages are read.
+
+    Parameters
+    ----------
+    filename : string
+        path to a file written by to_native
+    mode : string, default c
+        memory map mode; r for read-only, c for copy-on-write
+        (modifications are kept in memory only), r+ to modify the file
+
+    Returns
+    -------
+    ColumnarArray, datetime
+        the trajectories as memory mapped arrays and the start date
+    """
+    header = read_native_header(filename)
+    shape = tuple(header['shape'])
+    mapped = np.memmap(filename, dtype=np.uint8, mode=mode)
+    columns = []
+    for var in header['variables']:
+        dtype = np.dtype(var['dtype'])
+        size = dtype.itemsize * shape[0] * shape[1]
+        data = mapped[var['offset']:var['offset'] + size]
+        columns.append((var['name'], data.view(dtype).reshape(shape)))
+    startdate = datetime.fromisoformat(header['startdate'])
+    return ColumnarArray(columns, shape=shape), startdate
+
+
+def read_native_header(filename):
+    """return the header of a file in the native binary format"""
+    with open(filename, 'rb') as fname:
+        magic = fname.read(len(NATIVE_MAGIC))
+        if magic != NATIVE_MAGIC:
+            raise IOError('{} is not a native trajectory file'.format(
+                filename))
+        length, = struct.unpack('<I', fname.read(4))
+        header = json.loads(fname.read(length).decode('utf8'))
+    if header['version'] > NATIVE_VERSION:
+        raise IOError('{} was written by a newer version (format {})'.format(
+            filename, header['version']))
+    return header
+
+
+def is_native_file(filename):
+    """return True if filename is in the native binary format"""
+    try:
+        return detect_format(filename) == 'native'
+    except (OSError, IOError):
+        return False
+
+
+NETCDF_MAGICS = (b'CDF\x01', b'CDF\x02', b'CDF\x05')
+HDF5_MAGIC = b'\x89HDF\r\n\x1a\n'
+GZIP_MAGIC = b'\x1f\x8b'
+ASCII_HEADER = b'Reference date'
+
+
+def detect_format(filename):
+    """ Return the format of a trajectory file from its first bytes
+
+        Parameters
+        ----------
+        filename : string
+            path to the file
+
+        Returns
+        -------
+        string or None
+            'netcdf' (classic or HDF5 based netcdf), 'ascii',
+            'ascii.gz' (gzip compressed ascii), 'native' or None
+            if the format is unknown
+    """
+    with open(filename, 'rb') as fname:
+        start = fname.read(1024)
+        if start.startswith(NATIVE_MAGIC):
+            return 'native'
+        if start[:4] in NETCDF_MAGICS or start.startswith(HDF5_MAGIC):
+            return 'netcdf'
+        # the HDF5 signature may follow a user block of 512 * 2**n bytes
+        offset = 512
+        while offset < 2 ** 20:
+            fname.seek(offset)
+            signature = fname.read(len(HDF5_MAGIC))
+            if len(signature) < len(HDF5_MAGIC):
+                break
+            if signature == HDF5_MAGIC:
+                return 'netcdf'
+            offset *= 2
+    if start.startswith(GZIP_MAGIC):
+        try:
+            with gzip.open(filename, 'rb') as fname:
+                start = fname.read(len(ASCII_HEADER) + 64)
+        except (OSError, IOError, EOFError):
+            return None
+        if start.lstrip().startswith(ASCII_HEADER):
+            return 'ascii.gz'
+        return None
+    if start.lstrip().startswith(ASCII_HEADER):
+        return 'ascii'
+    return None
+
+
+def _align(offset):
+    """return the first aligned offset after offset"""
+    return -(-offset // NATIVE_ALIGNMENT) * NATIVE_ALIGNMENT
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keys of the cache of parsed trajectory files
+
+run with: python -m pytest test
+"""
+import os
+
+import numpy as np
+import pytest
+
+from package.traj import Tra
+from package.traj_cache import TrajCache
+from package.traj_utils import from_netcdf
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data')
+NTRA = 3000
+
+
+@pytest.fixture
+def netcdf(tmp_path):
+    """netcdf file of NTRA copies of the trajectory of data/traj.4"""
+    array, startdate = from_netcdf(os.path.join(DATA, 'traj.4'))
+    array = np.repeat(array, NTRA, axis=0)
+    array['lon'] += np.arange(NTRA)[:, None] * 0.01
+    trajs = Tra(array=array)
+    trajs._startdate = startdate
+    filename = tmp_path / 'trajs.4'
+    trajs.write(filename, fileformat='netcdf')
+    return filename
+
+
+def masks(count):
+    mask = np.zeros(NTRA, dtype=bool)
+    mask[:count] = True
+    return mask
+
+
+def test_key_long_arrays(netcdf, tmp_path):
+    cache = TrajCache(tmp_path / 'cache')
+    # the repr of these arrays are the same (shortened with ...)
+    assert repr(masks(3)) == repr(masks(4))
+    assert cache.key(netcdf, indices=masks(3)) != \
+        cache.key(netcdf, indices=masks(4))
+    assert cache.key(netcdf, indices=masks(3)) == \
+        cache.key(netcdf, indices=masks(3))
+    indices = np.arange(NTRA)
+    other = indices.copy()
+    other[500] = 0
+    assert cache.key(netcdf, indices=indices) != \
+        cache.key(netcdf, indices=other)
+
+
+def test_cached_masks(netcdf, tmp_path):
+    cache = TrajCache(tmp_path / 'cache')
+    for count in (3, 4, 3):
+        trajs = Tra(netcdf, cache=cache, indices=masks(count))
+        assert trajs.ntra == count
+        assert np.allclose(trajs['lon'][:, 0],
+                           trajs['lon'][0, 0] + np.arange(count) * 0.01)
+    assert len(cache._entries()) == 2
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kinematic fields of trajectories read with usedatetime=False
+
+run with: python -m pytest test
+"""
+import numpy as np
+import pytest
+
+from package.traj import Tra
+from package.traj_kinematics import (ground_speed, heading,
+                                     vertical_velocity)
+
+
+@pytest.fixture
+def trajs():
+    """half-hourly trajectory, times in hh.mm, p falling 1 hPa every 30
+    minutes, moving north by 0.1 degree every 30 minutes"""
+    array = np.zeros((1, 4), dtype=[('time', 'f8'), ('lon', 'f8'),
+                                    ('lat', 'f8'), ('p', 'f8')])
+    array['time'] = [0, 0.30, 1.00, 1.30]
+    array['lat'] = 0.1 * np.arange(4)
+    array['p'] = 1000 - np.arange(4)
+    return Tra(array=array)
+
+
+def test_vertical_velocity_hhmm(trajs):
+    assert np.allclose(vertical_velocity(trajs['p'], trajs['time']), -2)
+    assert np.allclose(trajs.derived('dpdt'), -2)
+
+
+def test_ground_speed_hhmm(trajs):
+    # 0.1 degree of latitude (11.1 km) in 30 minutes
+    speed = ground_speed(trajs['lon'], trajs['lat'], trajs['time'])
+    assert np.allclose(speed, speed[0, 0])
+    assert np.allclose(speed, 11119.5 / 1800, rtol=1e-3)
+    assert np.allclose(trajs.derived('speed'), speed)
+
+
+def test_heading_backward_hhmm(trajs):
+    trajs['time'] = -trajs['time']
+    assert np.allclose(heading(trajs['lon'], trajs['lat'], trajs['time']),
+                       180)
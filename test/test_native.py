@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Round trips of the native binary format against from_netcdf and from_ascii
+
+run with: python -m pytest test
+"""
+import os
+
+import numpy as np
+import pytest
+
+from package.traj import Tra
+from package.traj_storage import ColumnarArray
+from package.traj_utils import (from_ascii, from_native, from_netcdf,
+                                to_native)
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data')
+NETCDF = os.path.join(DATA, 'traj.4')
+ASCII = os.path.join(DATA, 'wcb.1')
+
+
+def roundtrip(array, startdate, filename, mode='c'):
+    trajs = Tra(array=array)
+    trajs._startdate = startdate
+    to_native(trajs, filename)
+    return from_native(filename, mode=mode)
+
+
+def assert_same(native, array):
+    assert native.shape == array.shape
+    assert native.dtype.names == array.dtype.names
+    for name in array.dtype.names:
+        assert native[name].dtype == array[name].dtype, name
+        assert np.array_equal(native[name], array[name],
+                              equal_nan=name != 'time'), name
+
+
+@pytest.mark.parametrize('reader, filename', [(from_netcdf, NETCDF),
+                                              (from_ascii, ASCII)])
+def test_roundtrip(tmp_path, reader, filename):
+    array, startdate = reader(filename)
+    native, nativedate = roundtrip(array, startdate, tmp_path / 'trajs.traj')
+    assert isinstance(native, ColumnarArray)
+    assert nativedate == startdate
+    assert_same(native, array)
+
+
+@pytest.mark.parametrize('reader, filename', [(from_netcdf, NETCDF),
+                                              (from_ascii, ASCII)])
+def test_roundtrip_tra(tmp_path, reader, filename):
+    array, _ = reader(filename)
+    native = tmp_path / 'trajs.traj'
+    Tra(filename).write(native, fileformat='native')
+    trajs = Tra(native)
+    assert trajs.startdate == Tra(filename).startdate
+    assert_same(trajs.get_array(), array)
+
+
+def test_missing_values_netcdf(tmp_path):
+    array, startdate = from_netcdf(NETCDF)
+    array['p'][0, [3, 10]] = -999
+    array['lon'][0, -1] = -999
+    trajs = Tra(array=array)
+    trajs._startdate = startdate
+    filename = tmp_path / 'missing.4'
+    trajs.write(filename, fileformat='netcdf')
+    array, startdate = from_netcdf(filename)
+    assert np.isnan(array['p'][0, [3, 10]]).all()
+    assert np.isnan(array['lon'][0, -1])
+    native, _ = roundtrip(array, startdate, tmp_path / 'missing.traj')
+    assert_same(native, array)
+
+
+def test_missing_values_ascii(tmp_path):
+    with open(ASCII) as fname:
+        lines = fname.readlines()
+    # RH of the first time step (characters 30 to 39)
+    lines[5] = lines[5][:30] + '  -999.999' + lines[5][40:]
+    filename = tmp_path / 'missing.1'
+    with open(filename, 'w') as fname:
+        fname.writelines(lines)
+    array, startdate = from_ascii(filename)
+    assert np.isnan(array['RH'][0, 0])
+    assert np.isfinite(array['RH'][0, 1:]).all()
+    native, _ = roundtrip(array, startdate, tmp_path / 'missing.traj')
+    assert_same(native, array)
+
+
+def test_memmap(tmp_path):
+    array, startdate = from_netcdf(NETCDF)
+    filename = tmp_path / 'trajs.traj'
+    native, _ = roundtrip(array, startdate, filename, mode='r')
+    for name in array.dtype.names:
+        assert isinstance(native[name].base, np.memmap), name
+        # the variables are aligned for the memory mapping
+        assert native[name].ctypes.data % 4096 == 0, name
+    with pytest.raises(ValueError):
+        native['p'][0, 0] = 0
+
+    # copy-on-write: the file is not modified
+    native, _ = from_native(filename, mode='c')
+    native['p'][0, 0] = 0
+    assert from_native(filename)[0]['p'][0, 0] == array['p'][0, 0]
+
+    native, _ = from_native(filename, mode='r+')
+    native['p'][0, 0] = 0
+    native['p'].base.flush()
+    del native
+    assert from_native(filename)[0]['p'][0, 0] == 0
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projection of trajectories with missing positions
+
+run with: python -m pytest test
+"""
+import os
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+from package.traj import Tra  # noqa: E402
+
+ccrs = pytest.importorskip('cartopy.crs')
+from package.traj_plot import plot_density, plot_trajs  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+@pytest.fixture(params=[False, True], ids=['structured', 'columnar'])
+def trajs(request):
+    trajs = Tra(os.path.join(DATA, 'wcb.1'), columnar=request.param)
+    trajs['lon'][0, [3, 4]] = np.nan
+    trajs['lat'][0, 10] = np.nan
+    return trajs
+
+
+def positions(trajs):
+    return np.array(trajs['lon']), np.array(trajs['lat'])
+
+
+def assert_unchanged(trajs, lon, lat):
+    assert np.array_equal(trajs['lon'], lon, equal_nan=True)
+    assert np.array_equal(trajs['lat'], lat, equal_nan=True)
+
+
+def test_project(trajs):
+    lon, lat = positions(trajs)
+    x, y = trajs.project(ccrs.Robinson())
+    assert_unchanged(trajs, lon, lat)
+    assert np.isnan(x[0, [3, 4, 10]]).all()
+    assert np.isfinite(x[0, :3]).all()
+
+
+@pytest.mark.parametrize('plot', [plot_trajs, plot_density])
+def test_plot_project(trajs, plot):
+    lon, lat = positions(trajs)
+    fig = plt.figure()
+    ax = plt.axes(projection=ccrs.Robinson())
+    plot(ax, trajs, 'p', project=True)
+    plt.close(fig)
+    assert_unchanged(trajs, lon, lat)
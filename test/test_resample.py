@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resampling of trajectories read with usedatetime=False (hh.mm times)
+
+run with: python -m pytest test
+"""
+import numpy as np
+import pytest
+
+from package.traj import Tra
+
+
+def make_trajs(times):
+    """trajectory with p = 1000 + 20 * hours at the hh.mm times"""
+    hours = np.trunc(times) + np.around((times - np.trunc(times)) * 100) / 60
+    array = np.zeros((1, len(times)), dtype=[('time', 'f8'), ('lon', 'f8'),
+                                            ('lat', 'f8'), ('p', 'f8')])
+    array['time'] = times
+    array['lon'] = 10 + hours
+    array['lat'] = 45
+    array['p'] = 1000 + 20 * hours
+    return Tra(array=array)
+
+
+@pytest.fixture
+def backward():
+    return make_trajs(np.array([0, -0.30, -1.00, -1.30, -2.00]))
+
+
+def test_resample_step_hhmm(backward):
+    resampled = backward.resample(step=0.5)
+    assert np.allclose(resampled['time'], [0, -0.30, -1, -1.30, -2])
+    assert np.allclose(resampled['p'], [1000, 990, 980, 970, 960])
+
+    resampled = backward.resample(step=0.25)
+    assert np.allclose(resampled['time'][0, :3], [0, -0.15, -0.30])
+    assert np.allclose(resampled['p'][0, :3], [1000, 995, 990])
+    assert np.allclose(resampled['lon'][0, :3], [10, 9.75, 9.5])
+
+
+def test_resample_times_hhmm(backward):
+    resampled = backward.resample(times=[0, -0.20, -0.40, -1.10, -2.10])
+    assert np.allclose(resampled['time'],
+                       [0, -0.20, -0.40, -1.10, -2.10])
+    assert np.allclose(resampled['p'][0, :4],
+                       1000 - 20 * np.array([0, 20, 40, 70]) / 60)
+    assert np.isnan(resampled['p'][0, 4])
+
+
+def test_align_hhmm(backward):
+    hourly = make_trajs(np.array([0., -1, -2, -3]))
+    merged = backward.concatenate(hourly, align=True)
+    assert np.allclose(merged['time'], [0, -1, -2])
+    assert np.allclose(merged['p'], [1000, 980, 960])
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Selection criteria on trajectories read with usedatetime=False
+
+run with: python -m pytest test
+"""
+import numpy as np
+import pytest
+
+from package.traj import Tra
+from package.traj_select import Fall, Statistic
+
+
+@pytest.fixture
+def trajs():
+    """half-hourly trajectories, times in hh.mm, p falling 100 hPa every
+    30 minutes"""
+    array = np.zeros((1, 5), dtype=[('time', 'f8'), ('lon', 'f8'),
+                                    ('lat', 'f8'), ('p', 'f8')])
+    array['time'] = [0, 0.30, 1.00, 1.30, 2.00]
+    array['p'] = 1000 - 100 * np.arange(5)
+    return Tra(array=array)
+
+
+@pytest.mark.parametrize('hours, fall', [(0.5, 100), (1, 200), (1.5, 300),
+                                         (2, 400)])
+def test_fall_hhmm(trajs, hours, fall):
+    assert len(trajs.select(Fall('p', fall, hours=hours))) == 1
+    assert len(trajs.select(Fall('p', fall + 50, hours=hours))) == 0
+
+
+def test_statistic_empty_window(trajs):
+    with pytest.raises(ValueError, match='no time step'):
+        trajs.select(Statistic('p', 'min', below=800, start=0.1, end=0.2))